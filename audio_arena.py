@@ -0,0 +1,180 @@
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+
+import numpy as np
+
+from ffmpeg_utils import get_ffmpeg_exe, run_ffmpeg
+import tracing
+
+ARENA_SAMPLE_RATE = 24000   # Edge TTS voices are 24 kHz mono
+ARENA_CHANNELS = 1
+SAMPLE_WIDTH = 2            # 16-bit PCM
+DECODE_BATCH = 64           # cues decoded per ffmpeg run (bounded by command-line length on Windows)
+
+
+class AudioArena:
+    """
+    Stores every narration cue as 16-bit PCM, appended to one file at a fixed sample rate,
+    with an index of (slide, point) -> (offset, length, source) kept next to it as JSON, where
+    source identifies the cue file it was decoded from (path, size, modification time).
+    Cues are decoded on the way in, many per ffmpeg run; durations are index lookups and the
+    final track is encoded once from the PCM.
+    """
+
+    def __init__(self, path, sample_rate=ARENA_SAMPLE_RATE, channels=ARENA_CHANNELS):
+        self.path = path
+        self.index_path = path + ".json"
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_bytes = SAMPLE_WIDTH * channels
+        self.index = {}
+        self._load()
+
+    # --- persistence ---
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved["sample_rate"] == self.sample_rate and saved["channels"] == self.channels:
+                # Entries written before sources were recorded have no source and are decoded again
+                self.index = {tuple(int(n) for n in key.split(":")): (tuple(value) + (None,))[:3]
+                              for key, value in saved["cues"].items()}
+        # Drop anything written after the last indexed cue (e.g. an interrupted append)
+        end = max((offset + length for offset, length, _ in self.index.values()), default=0)
+        with open(self.path, "ab") as f:
+            f.truncate(end * self.frame_bytes)
+
+    def save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sample_rate": self.sample_rate, "channels": self.channels,
+                       "cues": {f"{slide}:{point}": list(entry) for (slide, point), entry in sorted(self.index.items())}},
+                      f)
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def frames(self):
+        return os.path.getsize(self.path) // self.frame_bytes
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    # --- writing ---
+    def _append_pcm(self, slide, point, pcm_bytes, source=None):
+        offset = self.frames
+        with open(self.path, "ab") as f:
+            f.write(pcm_bytes)
+        self.index[(slide, point)] = (offset, len(pcm_bytes) // self.frame_bytes, source)
+        tracing.count("bytes_written", len(pcm_bytes))
+        return self.index[(slide, point)]
+
+    @staticmethod
+    def source_of(audio_path):
+        """
+        Identifies the current contents of a cue file, so a regenerated cue is decoded again.
+        """
+        stat = os.stat(audio_path)
+        return f"{os.path.abspath(audio_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def append_files(self, cues, progress_callback=None):
+        """
+        Decodes audio files (any format ffmpeg reads) into the arena, `cues` being a list of
+        ((slide, point), audio_path). One ffmpeg run decodes up to DECODE_BATCH files, writing
+        one raw PCM output per input; the outputs are then appended in order.
+        """
+        for start in range(0, len(cues), DECODE_BATCH):
+            batch = cues[start:start + DECODE_BATCH]
+            scratch_dir = tempfile.mkdtemp(prefix="arena_", dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                args = []
+                for _, audio_path in batch:
+                    args += ["-i", audio_path]
+                outputs = []
+                for i in range(len(batch)):
+                    outputs.append(os.path.join(scratch_dir, f"{i}.pcm"))
+                    args += ["-map", f"{i}:a", "-f", "s16le", "-ac", str(self.channels),
+                             "-ar", str(self.sample_rate), outputs[-1]]
+                with tracing.span("decode", cat="decode", cues=len(batch)):
+                    run_ffmpeg(args)
+                for ((slide, point), audio_path), output in zip(batch, outputs):
+                    tracing.count_file("bytes_read", audio_path)
+                    with open(output, "rb") as f:
+                        self._append_pcm(slide, point, f.read(), self.source_of(audio_path))
+            finally:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+            if progress_callback:
+                done = min(start + DECODE_BATCH, len(cues))
+                progress_callback(int(100 * done / len(cues)), f"Decoding audio {done}/{len(cues)}")
+
+    # --- reading ---
+    def duration(self, slide, point):
+        return self.index[(slide, point)][1] / self.sample_rate
+
+    def durations_map(self):
+        """
+        Same shape as measure_durations(): slide index -> durations of its points in order.
+        """
+        durations = {}
+        for slide, point in sorted(self.index):
+            durations.setdefault(slide, []).append(self.duration(slide, point))
+        return durations
+
+    def _ordered_ranges(self):
+        return [self.index[key][:2] for key in sorted(self.index)]
+
+    def _is_contiguous(self, ranges):
+        return all(ranges[i][0] + ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1))
+
+    def export(self, output_audio, bitrate="128k"):
+        """
+        Encodes the whole track once. If the cues are stored in playing order, ffmpeg reads the
+        arena file directly; otherwise they are streamed to it in order from the memory map.
+        """
+        self.save()
+        raw_input = ["-f", "s16le", "-ar", str(self.sample_rate), "-ac", str(self.channels)]
+        encode = ["-b:a", bitrate] if not output_audio.lower().endswith(".wav") else []
+        ranges = self._ordered_ranges()
+
+        with tracing.span("encode", cat="encode", seconds=sum(length for _, length in ranges) / self.sample_rate):
+            if ranges and self._is_contiguous(ranges) and ranges[0][0] == 0 and \
+                    ranges[-1][0] + ranges[-1][1] == self.frames:
+                run_ffmpeg(raw_input + ["-i", self.path] + encode + [output_audio])
+            else:
+                cmd = [get_ffmpeg_exe(), "-hide_banner", "-y", "-loglevel", "error"] + raw_input + \
+                      ["-i", "pipe:0"] + encode + [output_audio]
+                process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+                pcm = np.memmap(self.path, dtype=np.int16, mode="r").reshape(-1, self.channels)
+                try:
+                    for offset, length in ranges:
+                        process.stdin.write(pcm[offset:offset + length].tobytes())
+                finally:
+                    process.stdin.close()
+                if process.wait() != 0:
+                    raise RuntimeError(f"ffmpeg failed to encode {output_audio}")
+        tracing.count_file("bytes_written", output_audio)
+        print(f"🔊 Combined audio saved to {output_audio}")
+        return output_audio
+
+    @classmethod
+    def from_audio_map(cls, audio_map, path, progress_callback=None, **kwargs):
+        """
+        Builds (or brings up to date) an arena from the cue files of generate_audio_from_points.
+        Cues already in the arena are decoded again only if their file changed since; cues that
+        are no longer in `audio_map` are dropped from the index.
+        """
+        arena = cls(path, **kwargs)
+        wanted = {(slide_idx, point): fpath for slide_idx in audio_map
+                  for point, fpath in enumerate(audio_map[slide_idx], start=1)}
+        for key in set(arena.index) - set(wanted):
+            del arena.index[key]
+        stale = [(key, fpath) for key, fpath in sorted(wanted.items())
+                 if key not in arena.index or arena.index[key][2] != cls.source_of(fpath)]
+        arena.append_files(stale, progress_callback=progress_callback)
+        arena.save()
+        return arena
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import glob
+import logging
+import hashlib
+import argparse
+import threading
+
+from job_queue import JobScheduler, DONE, FAILED, CANCELLED
+from progress import setup_structured_logging, format_eta, LOG_FILE
+import tracing
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+def report_path(ppt_path, report_dir=None):
+    """
+    Report file of a deck: next to its video, or in `report_dir` with a suffix derived from the
+    deck's folder, so decks with the same name in different folders do not share a report.
+    """
+    name = os.path.splitext(os.path.basename(ppt_path))[0]
+    deck_dir = os.path.dirname(os.path.abspath(ppt_path))
+    if report_dir:
+        suffix = hashlib.sha1(os.path.normcase(deck_dir).encode("utf-8")).hexdigest()[:8]
+        return os.path.join(report_dir, f"{name}_{suffix}_report.json")
+    return os.path.join(deck_dir, name, name + "_report.json")
+
+
+def write_report(job, report_dir=None):
+    """
+    Writes the JSON report of a finished job: outcome, output, and seconds spent per stage.
+    """
+    report = {
+        "deck": os.path.abspath(job.ppt_path),
+        "deck_mtime": os.path.getmtime(job.ppt_path) if os.path.exists(job.ppt_path) else None,
+        "status": job.status,
+        "error": job.error,
+        "output": job.video_path if job.status == DONE else None,
+        "submitted_at": job.submitted_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "total_seconds": round(job.finished_at - job.started_at, 3) if job.started_at else 0.0,
+        "stage_timings": {stage: round(seconds, 3) for stage, seconds in job.stage_timings.items()},
+    }
+    path = report_path(job.ppt_path, report_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def is_up_to_date(ppt_path, report_dir=None):
+    """
+    True if a successful report exists for this exact version of the deck.
+    """
+    path = report_path(ppt_path, report_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return report.get("status") == DONE and report.get("deck_mtime") == os.path.getmtime(ppt_path)
+
+
+class HeadlessRunner:
+    """
+    Owns one scheduler for the whole process, so models, caches and stage statistics are shared by
+    every deck, and prints one line per job state change.
+    """
+
+    def __init__(self, jobs=2, tts_streams=3, report_dir=None, window=None, use_arena=False, segment_store=None,
+                 batch_tts=False):
+        self.report_dir = report_dir
+        self.window = window
+        self.use_arena = use_arena
+        self.segment_store = segment_store
+        self.batch_tts = batch_tts
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._last_status = {}
+        self.scheduler = JobScheduler(limits={"tts": tts_streams}, max_jobs=jobs,
+                                      on_update=self.on_update)
+
+    def on_update(self, job):
+        with self._lock:
+            if self._last_status.get(job.id) == job.status:
+                return
+            self._last_status[job.id] = job.status
+            if job.status in FINISHED:
+                path = write_report(job, self.report_dir)
+                if job.status != DONE:
+                    self.failures += 1
+                print(f"[{job.status}] {job.name} ({job.message}) report: {path}", flush=True)
+            else:
+                print(f"[{job.status}] {job.name}", flush=True)
+
+    def submit(self, ppt_path, force=False):
+        return self.scheduler.submit(ppt_path, force=force, window=self.window, use_arena=self.use_arena,
+                                     segment_store=self.segment_store, batch_tts=self.batch_tts)
+
+
+def find_decks(input_dir, recursive=False):
+    pattern = os.path.join(input_dir, "**", "*.pptx") if recursive else os.path.join(input_dir, "*.pptx")
+    # Skip PowerPoint's lock files (~$deck.pptx)
+    return sorted(p for p in glob.glob(pattern, recursive=recursive) if not os.path.basename(p).startswith("~$"))
+
+
+def watch(runner, input_dir, interval=5.0, recursive=False, stop_event=None):
+    """
+    Polls `input_dir` and queues decks that are new or changed since their last successful conversion.
+    A file is only queued once its size and modification time are unchanged between two polls,
+    so decks that are still being copied in are not picked up half-written.
+    """
+    stop_event = stop_event or threading.Event()
+    seen = {}      # path -> signature already queued or up to date
+    candidates = {}  # path -> signature observed on the previous poll
+    active = {}    # path -> job
+
+    print(f"👀 Watching {os.path.abspath(input_dir)} (every {interval:g}s)", flush=True)
+    while not stop_event.is_set():
+        for path in find_decks(input_dir, recursive):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_mtime, stat.st_size)
+            if seen.get(path) == signature:
+                continue
+            job = active.get(path)
+            if job is not None and job.status not in FINISHED:
+                continue
+            if candidates.get(path) != signature:
+                candidates[path] = signature
+                continue
+
+            seen[path] = signature
+            candidates.pop(path, None)
+            if is_up_to_date(path, runner.report_dir):
+                continue
+            active[path] = runner.submit(path, force=True)
+        stop_event.wait(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert PowerPoint decks to narrated videos without the desktop app.")
+    parser.add_argument("--jobs", type=int, default=2, help="Number of decks converted in parallel")
+    parser.add_argument("--tts-streams", type=int, default=3, help="Number of decks synthesizing speech at once")
+    parser.add_argument("--report-dir", default=None, help="Folder for the JSON reports (default: next to each video)")
+    parser.add_argument("--log-file", default=LOG_FILE, help="JSON-lines log with per-item detail")
+    parser.add_argument("--window", type=int, default=None,
+                        help="Process narration this many slides at a time to bound memory on very large decks")
+    parser.add_argument("--arena", action="store_true",
+                        help="Decode narration once into a PCM arena instead of re-decoding MP3 files per stage")
+    parser.add_argument("--batch-tts", action="store_true",
+                        help="One TTS request per slide instead of per point; also writes SRT captions")
+    parser.add_argument("--segment-store", default=None,
+                        help="Folder of a segment store shared by all decks; identical slides are rendered only once")
+    parser.add_argument("--store-gb", type=float, default=20.0, help="Size limit of the segment store")
+    parser.add_argument("--trace", default=None, help="Write a Chrome/Perfetto trace of the run to this JSON file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="Convert the given decks and exit")
+    convert_parser.add_argument("decks", nargs="+", help="PPTX files")
+    convert_parser.add_argument("--force", action="store_true", help="Discard outputs of previous conversions")
+
+    watch_parser = subparsers.add_parser("watch", help="Convert new or changed decks in a folder until stopped")
+    watch_parser.add_argument("input_dir", help="Folder to watch for PPTX files")
+    watch_parser.add_argument("--interval", type=float, default=5.0, help="Seconds between folder scans")
+    watch_parser.add_argument("--recursive", action="store_true", help="Also watch subfolders")
+    args = parser.parse_args(argv)
+    if args.window and args.arena:
+        parser.error("--window and --arena cannot be combined")
+    if args.segment_store and (args.window or args.arena):
+        parser.error("--segment-store cannot be combined with --window or --arena")
+    if args.segment_store and args.batch_tts:
+        parser.error("--segment-store cannot be combined with --batch-tts")
+
+    setup_structured_logging(args.log_file, level=logging.DEBUG)
+    if args.trace:
+        tracing.enable()
+    try:
+        return run_command(args)
+    finally:
+        if args.trace:
+            tracing.export_chrome_trace(args.trace)
+
+
+def run_command(args):
+    segment_store = None
+    if args.segment_store:
+        from segment_store import SegmentStore
+        segment_store = SegmentStore(args.segment_store, max_bytes=int(args.store_gb * 1024 ** 3))
+    runner = HeadlessRunner(jobs=args.jobs, tts_streams=args.tts_streams, report_dir=args.report_dir,
+                            window=args.window, use_arena=args.arena, segment_store=segment_store,
+                            batch_tts=args.batch_tts)
+
+    if args.command == "convert":
+        started = time.perf_counter()
+        for deck in args.decks:
+            runner.submit(deck, force=args.force)
+        try:
+            runner.scheduler.wait()
+        except KeyboardInterrupt:
+            runner.scheduler.shutdown()
+            runner.scheduler.wait()
+        print(f"Converted {len(args.decks) - runner.failures}/{len(args.decks)} decks "
+              f"in {format_eta(time.perf_counter() - started)}")
+        if segment_store is not None:
+            stats = segment_store.stats()
+            print(f"Segment store: {stats['hit_rate']:.0%} hit rate, {stats['segments']} segments, "
+                  f"{stats['bytes'] / 1024 ** 2:.0f} MB")
+        return 1 if runner.failures else 0
+
+    stop_event = threading.Event()
+    try:
+        watch(runner, args.input_dir, args.interval, args.recursive, stop_event)
+    except KeyboardInterrupt:
+        print("Stopping: waiting for running jobs to be cancelled...")
+        stop_event.set()
+        runner.scheduler.shutdown()
+        runner.scheduler.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import importlib
+import threading
+
+import tracing
+
+# name -> callable that imports and returns the backend
+_loaders = {}
+_loaded = {}
+_lock = threading.RLock()
+
+
+def register(name, loader):
+    """
+    Registers a backend under `name`; `loader()` runs on the first get(name) and its result is cached.
+    """
+    with _lock:
+        _loaders[name] = loader
+        _loaded.pop(name, None)
+
+
+def get(name):
+    """
+    Returns the backend, importing it on first use. Import failures surface as RuntimeError
+    naming the stage that needs the missing package.
+    """
+    backend = _loaded.get(name)
+    if backend is not None:
+        return backend
+    with _lock:
+        if name not in _loaded:
+            with tracing.span(f"load_{name}", cat="import"):
+                _loaded[name] = _loaders[name]()
+        return _loaded[name]
+
+
+def loaded():
+    return sorted(_loaded)
+
+
+def _module(module_name, needed_for):
+    def load():
+        try:
+            return importlib.import_module(module_name)
+        except ImportError as e:
+            raise RuntimeError(f"{needed_for} needs the '{module_name}' package: {e}") from e
+    return load
+
+
+def _load_powerpoint():
+    try:
+        import win32com.client
+    except ImportError as e:
+        raise RuntimeError(f"PowerPoint automation needs Windows with pywin32 installed: {e}") from e
+    return win32com.client
+
+
+def _load_pptx():
+    pptx = _module("pptx", "Reading presentations")()
+    importlib.import_module("pptx.enum.shapes")
+    return pptx
+
+
+register("numpy", _module("numpy", "Audio processing"))
+register("pptx", _load_pptx)
+register("powerpoint", _load_powerpoint)
+register("edge_tts", _module("edge_tts", "Speech synthesis"))
+register("pydub", _module("pydub", "Combining audio"))
+register("moviepy", _module("moviepy", "Audio/video processing"))
@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import argparse
+
+from ffmpeg_utils import run_ffmpeg
+import backends
+import tracing
+
+TICKS_PER_SECOND = 10_000_000   # edge-tts reports offsets in 100 ns units
+SILENCE_NOISE_DB = -40
+MIN_SILENCE = 0.2               # seconds
+
+
+def edge_tts_synthesize_words(text, fname, voice):
+    """
+    Synthesizes `text` with Edge TTS into `fname` and returns its word boundaries as (start, end, word) in seconds.
+    """
+    edge_tts = backends.get("edge_tts")
+    try:
+        communicate = edge_tts.Communicate(text, voice, boundary="WordBoundary")
+    except TypeError:
+        # edge-tts before 7.0 always reports word boundaries and has no `boundary` argument
+        communicate = edge_tts.Communicate(text, voice)
+    words = []
+    with open(fname, "wb") as f:
+        for chunk in communicate.stream_sync():
+            if chunk["type"] == "audio":
+                f.write(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                start = chunk["offset"] / TICKS_PER_SECOND
+                words.append((start, start + chunk["duration"] / TICKS_PER_SECOND, chunk["text"]))
+    return words
+
+
+def _spoken(text):
+    # Each point ends a sentence, so the voice pauses between points as it did with one request per point
+    return text if re.search(r"[.!?;:]$", text) else text + "."
+
+
+def assign_words(words, texts):
+    """
+    Works out which point each word boundary belongs to by finding the words, in order, in the joined text.
+    Returns one list of (start, end, word) per point.
+    """
+    joined, ends = "", []
+    for text in texts:
+        joined += _spoken(text) + "\n"
+        ends.append(len(joined))
+
+    per_point = [[] for _ in texts]
+    cursor, point = 0, 0
+    for start, end, word in words:
+        found = joined.find(word, cursor)
+        if found < 0:
+            continue   # the service normalized the word (numbers, abbreviations); keep the cursor
+        cursor = found + len(word)
+        while point < len(texts) - 1 and found >= ends[point]:
+            point += 1
+        per_point[point].append((start, end, word))
+    return per_point
+
+
+def boundaries_from_words(per_point):
+    """
+    Cut points between consecutive points: halfway through the pause between the last word of one
+    point and the first word of the next. Returns None when a point has no recognized word.
+    """
+    if any(not words for words in per_point):
+        return None
+    return [(per_point[i][-1][1] + per_point[i + 1][0][0]) / 2 for i in range(len(per_point) - 1)]
+
+
+def detect_silences(audio_path, noise_db=SILENCE_NOISE_DB, min_silence=MIN_SILENCE):
+    """
+    Returns (start, end) of the pauses in an audio file, using ffmpeg's silencedetect filter.
+    """
+    result = run_ffmpeg(["-i", audio_path, "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}",
+                         "-f", "null", "-"], quiet=False)
+    log = result.stderr.decode(errors="replace")
+    starts = [float(value) for value in re.findall(r"silence_start: (-?[\d.]+)", log)]
+    ends = [float(value) for value in re.findall(r"silence_end: ([\d.]+)", log)]
+    return list(zip(starts, ends))
+
+
+def boundaries_from_silences(silences, count):
+    """
+    Picks the `count` longest inner pauses (in time order) as cut points, or None if there are too few.
+    Pauses at the very start or end of the audio are not between points.
+    """
+    inner = [(start, end) for start, end in silences if start > 0.05]
+    if len(inner) < count:
+        return None
+    longest = sorted(sorted(inner, key=lambda s: s[1] - s[0], reverse=True)[:count])
+    return [(start + end) / 2 for start, end in longest]
+
+
+def split_audio(audio_path, cut_points, output_files):
+    """
+    Cuts one audio file into len(cut_points) + 1 clips with a single ffmpeg run.
+    """
+    args = ["-i", audio_path]
+    edges = [0.0] + list(cut_points) + [None]
+    for fname, start, end in zip(output_files, edges[:-1], edges[1:]):
+        args += ["-ss", f"{start:.3f}"] + (["-to", f"{end:.3f}"] if end is not None else [])
+        args += ["-c:a", "libmp3lame", "-b:a", "64k", fname]
+    run_ffmpeg(args)
+    return output_files
+
+
+def synthesize_slide(points, voice, output_dir, slide_idx, synthesize=None, synthesize_words=None):
+    """
+    Narrates all of a slide's text points with one TTS request and splits the result into
+    one clip per point (the files in `points`, a list of (text, fname)).
+    Cut points come from the word boundaries of `synthesize_words(text, fname, voice)`, or, for
+    backends without them (`synthesize(text, fname, voice)`), from the pauses between sentences.
+    The word timings of every point are saved next to the clips for captions.
+    Returns False when the audio could not be split; the caller then synthesizes point by point.
+    """
+    if synthesize is None and synthesize_words is None:
+        synthesize_words = edge_tts_synthesize_words
+    texts = [text for text, _ in points]
+    files = [fname for _, fname in points]
+    slide_audio = os.path.join(output_dir, f"slide_{slide_idx}_all.mp3")
+    request = "\n".join(_spoken(text) for text in texts)
+
+    with tracing.span("synthesize_slide", cat="tts", slide=slide_idx, points=len(points), chars=len(request)):
+        if synthesize_words is not None:
+            words = synthesize_words(request, slide_audio, voice)
+        else:
+            words = None
+            synthesize(request, slide_audio, voice)
+    tracing.count("tts_requests")
+    tracing.count_file("bytes_written", slide_audio)
+
+    try:
+        per_point = assign_words(words, texts) if words else None
+        cut_points = boundaries_from_words(per_point) if per_point else None
+        if cut_points is None and len(points) > 1:
+            cut_points = boundaries_from_silences(detect_silences(slide_audio), len(points) - 1)
+        if len(points) == 1:
+            cut_points = []
+            os.replace(slide_audio, files[0])
+        elif cut_points is None:
+            return False
+        else:
+            split_audio(slide_audio, cut_points, files)
+    finally:
+        if os.path.exists(slide_audio):
+            os.remove(slide_audio)
+
+    edges = [0.0] + cut_points
+    timings = []
+    for i, (text, fname) in enumerate(points):
+        point_words = per_point[i] if per_point else []
+        timings.append({"file": os.path.basename(fname), "text": text,
+                        "words": [(round(start - edges[i], 3), round(end - edges[i], 3), word)
+                                  for start, end, word in point_words]})
+    save_timings(output_dir, slide_idx, timings)
+    return True
+
+
+def words_file(output_dir, slide_idx):
+    return os.path.join(output_dir, f"slide_{slide_idx}_words.json")
+
+
+def save_timings(output_dir, slide_idx, timings):
+    """
+    Merges point entries ({"file", "text", "words"}) into a slide's words file, so points narrated
+    by an earlier run keep theirs. An entry without words does not replace one with words for the
+    same text (e.g. a cached clip whose text is recorded again).
+    """
+    path = words_file(output_dir, slide_idx)
+    entries = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            entries = {point["file"]: point for point in json.load(f)["points"]}
+    for timing in timings:
+        old = entries.get(timing["file"])
+        if timing["words"] or old is None or old["text"] != timing["text"]:
+            entries[timing["file"]] = timing
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"points": list(entries.values())}, f, indent=1, ensure_ascii=False)
+
+
+def _srt_time(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def write_srt(audio_map, durations_map, output_srt, max_words=8):
+    """
+    Writes SRT captions for a narration made with synthesize_slide, placed on the combined track
+    (clips concatenated in slide and point order). Points with word timings are split into
+    captions of at most `max_words` words; other points with a text (e.g. narrated point by point
+    after a failed split) get one caption with that text for their whole clip.
+    """
+    entries = []
+    elapsed = 0.0
+    for slide_idx in sorted(audio_map):
+        texts = {}
+        if audio_map[slide_idx]:
+            path = words_file(os.path.dirname(audio_map[slide_idx][0]), slide_idx)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    texts = {point["file"]: point for point in json.load(f)["points"]}
+        for fname, duration in zip(audio_map[slide_idx], durations_map[slide_idx]):
+            point = texts.get(os.path.basename(fname))
+            if point is not None and point["words"]:
+                words = point["words"]
+                for i in range(0, len(words), max_words):
+                    group = words[i:i + max_words]
+                    end = words[i + max_words][0] if i + max_words < len(words) else group[-1][1]
+                    entries.append((elapsed + group[0][0], elapsed + end, " ".join(w for _, _, w in group)))
+            elif point is not None:
+                entries.append((elapsed, elapsed + duration, point["text"]))
+            elapsed += duration
+
+    with open(output_srt, "w", encoding="utf-8") as f:
+        for number, (start, end, text) in enumerate(entries, start=1):
+            f.write(f"{number}\n{_srt_time(start)} --> {_srt_time(end)}\n{text}\n\n")
+    return output_srt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write SRT captions for a narration made with --batch-tts.")
+    parser.add_argument("audio_dir", help="Folder with the slide_<n>_point_<m>.mp3 clips and slide_<n>_words.json")
+    parser.add_argument("output_srt")
+    parser.add_argument("--max-words", type=int, default=8, help="Words per caption")
+    args = parser.parse_args(argv)
+
+    from lip_sync import load_audio_map
+    from generate_video import measure_durations
+    audio_map = load_audio_map(args.audio_dir)
+    write_srt(audio_map, measure_durations(audio_map), args.output_srt, max_words=args.max_words)
+
+
+if __name__ == "__main__":
+    main()
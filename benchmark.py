@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+import tracing
+
+from generate_video import (
+    generate_audio_from_points,
+    measure_durations,
+    combine_audio,
+    merge_audio_video
+)
+from chunked_pipeline import generate_audio_in_windows, concat_audio_chunks
+
+WORDS = ("data algorithm computer problem pattern model step input output memory network "
+         "program logic decision process value loop function system design").split()
+
+
+def build_synthetic_deck(path, slides=20, bullets=5, images=1, seed=0):
+    """
+    Builds a deck of "Title and Content" slides with random bullets and `images` pictures per slide.
+    The content is deterministic for a given seed, so runs are comparable.
+    """
+    from pptx import Presentation
+    from pptx.util import Inches
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image_path = os.path.join(os.path.dirname(os.path.abspath(path)), "synthetic_image.png")
+    Image.new("RGB", (320, 240), (40, 120, 200)).save(image_path)
+
+    prs = Presentation()
+    layout = prs.slide_layouts[1]
+    for slide_idx in range(1, slides + 1):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {slide_idx}: {rng.choice(WORDS).capitalize()}"
+        body = slide.placeholders[1].text_frame
+        for bullet_idx in range(bullets):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))).capitalize() + "."
+            para = body.paragraphs[0] if bullet_idx == 0 else body.add_paragraph()
+            para.text = text
+        for image_idx in range(images):
+            slide.shapes.add_picture(image_path, Inches(6 + image_idx * 0.5), Inches(4.5), width=Inches(2))
+    prs.save(path)
+    os.remove(image_path)
+    return path
+
+
+def fake_tts(text, fname, voice=None):
+    """
+    Offline stand-in for Edge TTS: a tone whose length follows the text (about 14 characters per second).
+    """
+    from pydub.generators import Sine
+
+    duration_ms = min(15000, 300 + 70 * len(text))
+    Sine(220).to_audio_segment(duration=duration_ms, volume=-20).set_frame_rate(24000).set_channels(1) \
+        .export(fname, format="mp3", bitrate="48k")
+
+
+def build_synthetic_video(path, duration, size=(1280, 720), fps=30):
+    from moviepy import ColorClip
+
+    clip = ColorClip(size=size, color=(255, 255, 255), duration=duration)
+    clip.write_videofile(path, fps=fps, codec="libx264", preset="ultrafast", logger=None)
+    clip.close()
+    return path
+
+
+def time_call(func, repeat, setup=None):
+    """
+    Runs `func` `repeat` times (calling `setup` untimed before each run) and returns the timings and last result.
+    """
+    timings, result = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return timings, result
+
+
+def summarize(timings, items):
+    best = min(timings)
+    return {
+        "seconds_min": round(best, 4),
+        "seconds_median": round(statistics.median(timings), 4),
+        "items": items,
+        "items_per_second": round(items / best, 2) if best > 0 else None,
+        "runs": len(timings),
+    }
+
+
+def run_benchmarks(work_dir, slides=20, bullets=5, images=1, repeat=3, classifier=False, seed=0):
+    """
+    Times each pipeline stage separately on a synthetic deck with the offline TTS and returns the results.
+    """
+    results = {}
+    deck = build_synthetic_deck(os.path.join(work_dir, "synthetic.pptx"), slides, bullets, images, seed)
+    audio_dir = os.path.join(work_dir, "audio")
+
+    def fresh_audio_dir():
+        shutil.rmtree(audio_dir, ignore_errors=True)
+
+    timings, audio_map = time_call(lambda: generate_audio_from_points(deck, audio_dir, synthesize=fake_tts),
+                                   repeat, setup=fresh_audio_dir)
+    cues = sum(len(files) for files in audio_map.values())
+    results["generate_audio_from_points"] = summarize(timings, cues)
+
+    timings, durations = time_call(lambda: measure_durations(audio_map), repeat)
+    results["measure_durations"] = summarize(timings, cues)
+
+    combined_audio = os.path.join(work_dir, "combined_audio.mp3")
+    timings, _ = time_call(lambda: combine_audio(audio_map, combined_audio), repeat)
+    results["combine_audio"] = summarize(timings, cues)
+
+    # The PCM arena replaces measure_durations + combine_audio: one decode per cue, one encode
+    from audio_arena import AudioArena
+    arena_path = os.path.join(work_dir, "audio_arena.pcm")
+
+    def fresh_arena():
+        for path in (arena_path, arena_path + ".json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    timings, arena = time_call(lambda: AudioArena.from_audio_map(audio_map, arena_path), repeat, setup=fresh_arena)
+    results["arena_build_and_durations"] = summarize(timings, cues)
+    timings, _ = time_call(lambda: arena.export(os.path.join(work_dir, "combined_audio.wav")), repeat)
+    results["arena_export"] = summarize(timings, cues)
+
+    total_seconds = sum(sum(durs) for durs in durations.values())
+    video = build_synthetic_video(os.path.join(work_dir, "synthetic_ppt.mp4"), total_seconds)
+    merged = os.path.join(work_dir, "merged.mp4")
+    timings, _ = time_call(lambda: merge_audio_video(video, combined_audio, merged), repeat)
+    results["merge_audio_video"] = summarize(timings, round(total_seconds, 2))
+
+    from sync_verifier import verify_sync
+    timings, _ = time_call(lambda: verify_sync(merged, durations), repeat)
+    results["verify_sync"] = summarize(timings, round(total_seconds, 2))
+
+    if classifier:
+        started = time.perf_counter()
+        from gender_classifier import classify_gender_age
+        results["gender_classifier_load"] = summarize([time.perf_counter() - started], 1)
+
+        windows = [(start, start + 3.0) for start in range(0, int(total_seconds) - 3, 10)][:20]
+        timings, _ = time_call(lambda: [classify_gender_age(combined_audio, s, e) for s, e in windows], repeat)
+        results["classify_gender_age"] = summarize(timings, len(windows))
+
+        from voice_timeline import analyze_voice_timeline
+        timings, _ = time_call(lambda: analyze_voice_timeline(combined_audio, window_seconds=3.0, hop_seconds=1.0), repeat)
+        results["voice_timeline"] = summarize(timings, round(total_seconds, 2))
+
+    return results
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB (Unix only).
+    """
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_windowed_audio(deck, work_dir, window):
+    """
+    Runs the memory-bounded narration path (windows, spilled durations, chunk concat) with the offline TTS.
+    """
+    durations, chunks = generate_audio_in_windows(deck, work_dir, window, synthesize=fake_tts)
+    cues = sum(len(durations[idx]) for idx in durations)
+    durations.close()
+    concat_audio_chunks(chunks, os.path.join(work_dir, "combined_audio.mp3"))
+    return cues
+
+
+def run_memory_stress(slide_counts, window, bullets, ceiling_mb):
+    """
+    Runs the windowed pipeline on decks of increasing size, each in a fresh process, and checks that
+    peak RSS stays under `ceiling_mb` whatever the slide count. Returns the measurements and whether all passed.
+    """
+    measurements = {}
+    passed = True
+    for slides in slide_counts:
+        with tempfile.TemporaryDirectory(prefix="autonarrate_stress_") as work_dir:
+            # The deck is built here so that only the pipeline is measured in the child process
+            deck = build_synthetic_deck(os.path.join(work_dir, "stress.pptx"), slides, bullets, images=0)
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--stress-child", deck,
+                                     "--window", str(window)],
+                                    stdout=subprocess.PIPE, check=True, text=True)
+        child = json.loads(result.stdout.strip().splitlines()[-1])
+        ok = child["peak_rss_mb"] <= ceiling_mb
+        passed = passed and ok
+        measurements[str(slides)] = dict(child, within_ceiling=ok)
+        print(f"{slides:6d} slides  {child['cues']:7d} cues  peak RSS {child['peak_rss_mb']:8.1f} MB "
+              f"{'✅' if ok else f'❌ over {ceiling_mb} MB'}", flush=True)
+    return measurements, passed
+
+
+def compare(baseline, current, tolerance=0.10):
+    """
+    Prints the change of every stage's best time against a baseline; returns the stages that got slower than `tolerance`.
+    """
+    regressions = []
+    for stage in sorted(set(baseline["results"]) | set(current["results"])):
+        old = baseline["results"].get(stage, {}).get("seconds_min")
+        new = current["results"].get(stage, {}).get("seconds_min")
+        if old is None or new is None:
+            print(f"{stage:32s} {'-' if old is None else f'{old:.4f}s':>10s} -> {'-' if new is None else f'{new:.4f}s':>10s}")
+            continue
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(stage)
+            flag = "  ⚠️ slower"
+        print(f"{stage:32s} {old:9.4f}s -> {new:9.4f}s {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic decks (no network, no PowerPoint).")
+    parser.add_argument("--slides", type=int, default=20)
+    parser.add_argument("--bullets", type=int, default=5, help="Bullets per slide")
+    parser.add_argument("--images", type=int, default=1, help="Pictures per slide (the 2nd picture adds a silent cue)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best run is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--classifier", action="store_true", help="Also time the age/gender classifier (downloads the model)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before --compare fails")
+    parser.add_argument("--trace", default=None, help="Also write a Chrome/Perfetto trace of the runs")
+    parser.add_argument("--stress", default=None, metavar="SLIDES",
+                        help="Memory stress test: comma-separated slide counts, e.g. 100,500,1500")
+    parser.add_argument("--window", type=int, default=25, help="Slides per window in the stress test")
+    parser.add_argument("--memory-ceiling", type=float, default=1024, help="Allowed peak RSS in MB for --stress")
+    parser.add_argument("--stress-child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.stress_child:
+        work_dir = os.path.dirname(os.path.abspath(args.stress_child))
+        cues = run_windowed_audio(args.stress_child, work_dir, args.window)
+        print(json.dumps({"cues": cues, "peak_rss_mb": round(peak_rss_mb(), 1)}))
+        return 0
+
+    if args.stress:
+        slide_counts = [int(n) for n in args.stress.split(",")]
+        measurements, passed = run_memory_stress(slide_counts, args.window, args.bullets, args.memory_ceiling)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": {"stress": slide_counts, "window": args.window, "bullets": args.bullets,
+                                  "memory_ceiling_mb": args.memory_ceiling},
+                       "memory": measurements}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0 if passed else 1
+
+    if args.trace:
+        tracing.enable()
+
+    with tempfile.TemporaryDirectory(prefix="autonarrate_bench_") as work_dir:
+        results = run_benchmarks(work_dir, args.slides, args.bullets, args.images,
+                                 args.repeat, args.classifier, args.seed)
+
+    report = {
+        "config": {"slides": args.slides, "bullets": args.bullets, "images": args.images,
+                   "repeat": args.repeat, "seed": args.seed},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "processor": platform.processor()},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"📊 Benchmark results saved to {args.output}")
+    if args.trace:
+        tracing.export_chrome_trace(args.trace)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("⚠️ Baseline was recorded with a different configuration")
+        if compare(baseline, report, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
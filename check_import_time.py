@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Cumulative import time allowed per entry point, in milliseconds (cold start, best of --repeat runs)
+BUDGETS_MS = {
+    "generate_video": 60,
+    "job_queue": 120,
+    "preview": 80,
+    "autonarrate_cli": 150,
+    "benchmark": 100,   # must stay importable without PowerPoint (no win32com) on headless machines
+    "render_cluster": 150,
+    "segment_store": 100,
+    "desktop_app": 1500,
+}
+
+# Heavy packages that must only be loaded by the stage that needs them (see backends.py)
+DEFERRED = ("win32com", "pythoncom", "numpy", "moviepy", "pydub", "edge_tts", "pptx", "torch", "transformers")
+
+
+def measure_import(module, python=sys.executable):
+    """
+    Imports `module` in a fresh interpreter with `-X importtime`.
+    Returns (cumulative milliseconds, names of all modules imported on the way).
+    """
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"], cwd=HERE,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+
+    total_us, imported = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            total_us = int(cumulative)
+    return (total_us or 0) / 1000, imported
+
+
+def check(budgets, repeat=3, python=sys.executable):
+    """
+    Returns one result dict per module; `ok` is False when the module blew its budget,
+    pulled in a deferred package, or could not be imported.
+    """
+    results = []
+    for module, budget in budgets.items():
+        try:
+            runs = [measure_import(module, python) for _ in range(repeat)]
+        except RuntimeError as e:
+            results.append({"module": module, "budget_ms": budget, "ok": False, "error": str(e)})
+            continue
+        best = min(ms for ms, _ in runs)
+        eager = sorted({name.split(".")[0] for name in runs[0][1]} & set(DEFERRED))
+        results.append({"module": module, "ms": round(best, 1), "budget_ms": budget,
+                        "eager_imports": eager, "ok": best <= budget and not eager})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail when importing the app's entry points gets slower.")
+    parser.add_argument("modules", nargs="*", help="Modules to check (default: all with a budget)")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="Override or add a budget, e.g. --budget desktop_app=800")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module; the fastest counts")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    budgets = dict(BUDGETS_MS)
+    for override in args.budget:
+        module, _, ms = override.partition("=")
+        budgets[module] = float(ms)
+    if args.modules:
+        budgets = {module: budgets.get(module, BUDGETS_MS.get(module, 100)) for module in args.modules}
+
+    results = check(budgets, repeat=args.repeat)
+    for result in results:
+        if "error" in result:
+            print(f"FAIL {result['module']:<18} {result['error']}")
+            continue
+        status = "ok  " if result["ok"] else "FAIL"
+        eager = f"  eagerly imports {', '.join(result['eager_imports'])}" if result["eager_imports"] else ""
+        print(f"{status} {result['module']:<18} {result['ms']:8.1f} ms (budget {result['budget_ms']:g} ms){eager}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
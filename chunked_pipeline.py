@@ -0,0 +1,171 @@
+import os
+import gc
+import shelve
+from collections.abc import Mapping
+
+from generate_video import (
+    generate_audio_from_points,
+    measure_durations,
+    combine_audio,
+    DEFAULT_VOICE
+)
+from ffmpeg_utils import run_ffmpeg
+import tracing
+import backends
+
+DEFAULT_WINDOW = 25
+CHUNK_SAMPLE_RATE = 44100
+
+
+class SpilledDurations(Mapping):
+    """
+    Slide index -> list of cue durations, kept in an on-disk shelve instead of memory.
+    Can be passed anywhere a durations_map is expected (e.g. apply_point_timings).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = shelve.open(path)
+        self.closed = False
+
+    def __getitem__(self, slide_idx):
+        return self._db[str(slide_idx)]
+
+    def __setitem__(self, slide_idx, durations):
+        self._db[str(slide_idx)] = list(durations)
+
+    def __contains__(self, slide_idx):
+        return str(slide_idx) in self._db
+
+    def __iter__(self):
+        return iter(sorted(int(key) for key in self._db.keys()))
+
+    def __len__(self):
+        return len(self._db)
+
+    def sync(self):
+        self._db.sync()
+
+    def close(self):
+        if not self.closed:
+            self._db.close()
+            self.closed = True
+
+
+class SpilledClips(SpilledDurations):
+    """
+    Slide index -> list of the cue files the windowed narration made for it, kept on disk like
+    the durations, so captions can be placed on exactly the clips that were measured.
+    """
+
+
+def slide_windows(slide_count, window=DEFAULT_WINDOW):
+    """
+    Yields the 1-based slide indices of consecutive windows of at most `window` slides.
+    """
+    for start in range(1, slide_count + 1, window):
+        yield list(range(start, min(start + window, slide_count + 1)))
+
+
+def generate_audio_in_windows(ppt_path, work_dir, window=DEFAULT_WINDOW, synthesize=None,
+                              voice=DEFAULT_VOICE, progress_callback=None, batch_slides=False, clips=None):
+    """
+    Synthesizes, measures and combines the narration one slide window at a time.
+    The deck is parsed once; each window's durations go to an on-disk store and its audio to a WAV chunk,
+    so apart from the parsed deck itself memory use depends on the window size, not on the deck size.
+    Finished chunks are kept, so an interrupted run resumes. The store is closed again if a window fails.
+    With `clips` (a SpilledClips, owned by the caller), each slide's cue files are recorded as well.
+    Returns (durations store, list of chunk files in order).
+    """
+    audio_dir = os.path.join(work_dir, "audio")
+    chunk_dir = os.path.join(work_dir, "audio_chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+    prs = backends.get("pptx").Presentation(ppt_path)
+    slide_count = len(prs.slides)
+    windows = list(slide_windows(slide_count, window))
+    durations = SpilledDurations(os.path.join(work_dir, "durations.db"))
+    chunks = []
+    try:
+        for window_idx, slides in enumerate(windows, start=1):
+            chunk_path = os.path.join(chunk_dir, f"chunk_{slides[0]:05d}_{slides[-1]:05d}.wav")
+            if progress_callback:
+                progress_callback(int(100 * (window_idx - 1) / len(windows)),
+                                  f"Slides {slides[0]}-{slides[-1]} of {slide_count}")
+            if all(idx in durations for idx in slides) and (clips is None or all(idx in clips for idx in slides)):
+                if os.path.exists(chunk_path):
+                    chunks.append(chunk_path)
+                    continue
+                if not any(durations[idx] for idx in slides):
+                    continue  # window without narration
+
+            with tracing.span("audio_window", cat="window", first_slide=slides[0], last_slide=slides[-1]):
+                audio_map = generate_audio_from_points(ppt_path, audio_dir, slides=set(slides), synthesize=synthesize,
+                                                       voice=voice, batch_slides=batch_slides, presentation=prs)
+                window_durations = measure_durations(audio_map)
+
+                if any(audio_map.values()):
+                    # Chunks share one PCM format so the concat demuxer can join them without decoding
+                    raw_chunk = chunk_path + ".raw.wav"
+                    combine_audio(audio_map, raw_chunk, format="wav")
+                    run_ffmpeg(["-i", raw_chunk, "-ar", str(CHUNK_SAMPLE_RATE), "-ac", "2",
+                                "-c:a", "pcm_s16le", chunk_path + ".tmp.wav"])
+                    os.remove(raw_chunk)
+                    os.replace(chunk_path + ".tmp.wav", chunk_path)
+                    chunks.append(chunk_path)
+
+                # Durations are stored last, so a window only counts as done once its chunk exists
+                for slide_idx in slides:
+                    if clips is not None:
+                        clips[slide_idx] = audio_map.get(slide_idx, [])
+                    durations[slide_idx] = window_durations.get(slide_idx, [])
+                if clips is not None:
+                    clips.sync()
+                durations.sync()
+            del audio_map, window_durations
+            gc.collect()
+    except BaseException:
+        durations.close()
+        raise
+
+    if progress_callback:
+        progress_callback(100, "Audio windows completed.")
+    return durations, chunks
+
+
+def concat_audio_chunks(chunks, output_audio, bitrate="128k"):
+    """
+    Joins the WAV chunks with ffmpeg's concat demuxer and encodes the narration once, streaming from disk.
+    """
+    list_file = output_audio + ".txt"
+    with open(list_file, "w", encoding="utf-8") as f:
+        for path in chunks:
+            escaped = os.path.abspath(path).replace("\\", "/").replace("'", r"'\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        with tracing.span("encode", cat="encode", chunks=len(chunks)):
+            run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_file,
+                        "-c:a", "libmp3lame", "-b:a", bitrate, output_audio])
+    finally:
+        os.remove(list_file)
+    print(f"🔊 Combined audio saved to {output_audio}")
+    return output_audio
+
+
+def mux_audio_video(video_path, audio_path, output_video):
+    """
+    Adds the narration to the PowerPoint video without re-encoding the video stream.
+    ffmpeg streams both inputs, so memory stays flat however long the video is.
+    Without `audio_path`, a silent track is added so every output has the same stream layout.
+    The audio is always AAC at 44.1 kHz stereo, so outputs can be concatenated by stream copy.
+    """
+    if audio_path:
+        audio_input = ["-i", audio_path]
+    else:
+        audio_input = ["-f", "lavfi", "-i", f"anullsrc=r={CHUNK_SAMPLE_RATE}:cl=stereo", "-shortest"]
+    with tracing.span("mux", cat="encode"):
+        run_ffmpeg(["-i", video_path] + audio_input + ["-map", "0:v", "-map", "1:a",
+                    "-c:v", "copy", "-c:a", "aac", "-ar", str(CHUNK_SAMPLE_RATE), "-ac", "2",
+                    "-movflags", "+faststart", output_video])
+    print(f"🎬 Merged video saved to {output_video}")
+    return output_video
+
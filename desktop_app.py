@@ -6,79 +6,42 @@ from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget,
     QVBoxLayout, QHBoxLayout, QPushButton,
     QLabel, QFileDialog, QMessageBox,
-    QSlider, QFrame, QProgressBar  
+    QSlider, QFrame, QProgressBar, QListWidget,
+    QListWidgetItem, QSpinBox
 )
 from custome_frame import RectFrame
-from PySide6.QtCore import Qt, QThread, Signal, Slot, QTimer
+from PySide6.QtCore import Qt, QObject, QThread, Signal, Slot, QTimer
 from PySide6.QtWidgets import QSizePolicy
 import vlc
 
-from generate_video import (
-    generate_audio_from_points,
-    measure_durations,
-    apply_point_timings,
-    ppt_to_video,
-    combine_audio,
-    merge_audio_video
-)
+from job_queue import JobScheduler, PENDING, RUNNING, PAUSED, DONE
+from progress import setup_structured_logging, format_eta
+from preview import generate_slide_preview
+
+# Relays scheduler callbacks (made from job threads) to the UI thread
+class SchedulerBridge(QObject):
+    job_updated = Signal(object)
+
 
-# Worker thread to run PowerPoint-to-video conversion without freezing the UI
-class ConversionWorker(QThread):
-    finished = Signal(str)       # Emitted with video path on success
+# Worker thread that renders a single-slide preview
+class PreviewWorker(QThread):
+    finished = Signal(str)       # Emitted with preview path on success
     error = Signal(str)          # Emitted with error message on failure
-    progress = Signal(int, str)  
+    progress = Signal(int, str)
 
-    def __init__(self, ppt_path: str):
+    def __init__(self, ppt_path: str, slide_index: int, scheduler):
         super().__init__()
         self.ppt_path = ppt_path
-        video_file_name = os.path.splitext(os.path.basename(self.ppt_path))[0]
-        parent_dir = os.path.dirname(os.path.abspath(self.ppt_path))
-        self.video_dir = os.path.join(parent_dir, video_file_name)
-        
-        if not os.path.exists(self.video_dir):
-            os.makedirs(self.video_dir)
-
-        self.video_path = os.path.join(self.video_dir, video_file_name + ".mp4")
-        self.ppt_video_path = os.path.join(self.video_dir, video_file_name + "_ppt.mp4")
-        self.audio_dir = os.path.join(self.video_dir, "audio")
-        
+        self.slide_index = slide_index
+        self.scheduler = scheduler
 
     def run(self):
         try:
-            self.progress.emit(0, "Starting audio generation...")
-            audio_map = generate_audio_from_points(self.ppt_path, self.audio_dir, progress_callback=lambda p, m: self.progress.emit(p, "Audio: " + m))
-            self.progress.emit(0, "Starting duration measurement...")
-            durations_map = measure_durations(audio_map, progress_callback=lambda p, m: self.progress.emit(p, "Duration: " + m))
-            
-            self.progress.emit(0, "Starting point timing...")
-            for attempt in range(3):
-                try:
-                    apply_point_timings(self.ppt_path, durations_map, progress_callback=lambda p, m: self.progress.emit(p, "Point timing: " + m))
-                    break  # Success, exit the retry loop
-                except Exception as e:
-                    if attempt == 2:
-                        self.error.emit(f"Video generation failed during point timing: {e}")
-                        return  # Stop further processing
-                    self.progress.emit(0, f"Retrying point timing due to error: {e} (attempt {attempt + 2}/3)")
-            
-            self.progress.emit(0, "Starting video generation...")
-            if not os.path.exists(self.ppt_video_path):
-                ppt_to_video(self.ppt_path, self.ppt_video_path, use_timings=True, default_slide_duration=7, progress_callback=lambda p, m: self.progress.emit(p, "Video: " + m))
-            # combine generated audio and merge with video
-            self.progress.emit(0, "Starting audio combination...")
-            combined_audio_file = os.path.join(self.video_dir, "combined_audio.mp3")
-            if not os.path.exists(combined_audio_file):
-                combine_audio(audio_map,combined_audio_file, progress_callback=lambda p, m: self.progress.emit(p, "Audio: " + m))
-            self.progress.emit(0, "Starting merge audio and video...")
-            
-            if not os.path.exists(self.video_path):
-                merge_audio_video(self.ppt_video_path, combined_audio_file,  self.video_path, progress_callback=lambda p, m: self.progress.emit(p, "Merge: " + m))
-                    
-            self.progress.emit(100, "Done")
-            # Notify success
-            self.finished.emit(self.video_path)
+            path = generate_slide_preview(self.ppt_path, self.slide_index,
+                                          render_slot=lambda: self.scheduler.resource("render"),
+                                          progress_callback=lambda p, m: self.progress.emit(p, "Preview: " + m))
+            self.finished.emit(path)
         except Exception as e:
-            # Notify error
             self.error.emit(str(e))
 
 
@@ -88,9 +51,15 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("AutoNarrate")
         self.resize(800, 600)
 
-        self.ppt_path = ""
+        self.ppt_paths = []
+        self.preview_ppt_path = ""
         self.video_path = ""
-        self.worker = None
+        self.job_items = {}
+        self.preview_worker = None
+
+        self.bridge = SchedulerBridge()
+        self.bridge.job_updated.connect(self.on_job_updated)
+        self.scheduler = JobScheduler(on_update=self.bridge.job_updated.emit)
 
         # Set up UI
         central = QWidget()
@@ -105,10 +74,17 @@ class MainWindow(QMainWindow):
         self.file_label = QLabel("No file selected")
         self.file_button = QPushButton("Select PPTX")
         self.file_button.clicked.connect(self.select_ppt)
-        self.generate_button = QPushButton("Generate Video")
+        self.generate_button = QPushButton("Add to Queue")
         self.generate_button.clicked.connect(self.generate_video)
+        self.slide_spin = QSpinBox()
+        self.slide_spin.setRange(1, 9999)
+        self.slide_spin.setPrefix("Slide ")
+        self.preview_button = QPushButton("Preview Slide")
+        self.preview_button.clicked.connect(self.preview_slide)
         top_row_layout.addWidget(self.file_label)
         top_row_layout.addWidget(self.file_button)
+        top_row_layout.addWidget(self.slide_spin)
+        top_row_layout.addWidget(self.preview_button)
         top_row_layout.addWidget(self.generate_button)
         main_layout.addWidget(top_row_frame, 0)
 
@@ -124,6 +100,33 @@ class MainWindow(QMainWindow):
         progress_layout.addWidget(self.progress_bar)
         main_layout.addWidget(progress_frame, 0)
 
+        # --- Queue Frame: queued decks and queue controls ---
+        queue_frame = RectFrame()
+        queue_layout = QHBoxLayout(queue_frame)
+        queue_layout.setContentsMargins(10, 10, 10, 10)
+        self.queue_list = QListWidget()
+        self.queue_list.setMaximumHeight(120)
+        self.queue_list.currentItemChanged.connect(self.on_job_selected)
+        self.queue_list.itemDoubleClicked.connect(self.play_job)
+        queue_buttons = QVBoxLayout()
+        self.pause_job_button = QPushButton("Pause/Resume")
+        self.pause_job_button.clicked.connect(self.toggle_pause_job)
+        self.cancel_job_button = QPushButton("Cancel")
+        self.cancel_job_button.clicked.connect(self.cancel_job)
+        self.up_button = QPushButton("Move Up")
+        self.up_button.clicked.connect(lambda: self.move_job(-1))
+        self.down_button = QPushButton("Move Down")
+        self.down_button.clicked.connect(lambda: self.move_job(1))
+        self.pause_queue_button = QPushButton("Pause Queue")
+        self.pause_queue_button.setCheckable(True)
+        self.pause_queue_button.toggled.connect(self.toggle_pause_queue)
+        for button in (self.pause_job_button, self.cancel_job_button, self.up_button,
+                       self.down_button, self.pause_queue_button):
+            queue_buttons.addWidget(button)
+        queue_layout.addWidget(self.queue_list, 1)
+        queue_layout.addLayout(queue_buttons)
+        main_layout.addWidget(queue_frame, 0)
+
         # --- Video Frame Group: Video display and controls ---
         video_frame_group = RectFrame()
         video_layout = QVBoxLayout(video_frame_group)
@@ -186,36 +189,146 @@ class MainWindow(QMainWindow):
 
     @Slot()
     def select_ppt(self):
-        file, _ = QFileDialog.getOpenFileName(
-            self, "Select PPTX File", "", "PowerPoint Files (*.pptx)"
+        files, _ = QFileDialog.getOpenFileNames(
+            self, "Select PPTX Files", "", "PowerPoint Files (*.pptx)"
         )
-        if file:
-            self.ppt_path = file
-            self.file_label.setText(os.path.basename(file))
+        if files:
+            self.ppt_paths = files
+            self.preview_ppt_path = files[0]
+            if len(files) == 1:
+                self.file_label.setText(os.path.basename(files[0]))
+            else:
+                self.file_label.setText(f"{len(files)} files selected")
 
     @Slot()
     def generate_video(self):
-        if not self.ppt_path:
+        if not self.ppt_paths:
+            QMessageBox.warning(self, "Warning", "Please select a PPTX file first.")
+            return
+
+        # Queue every selected deck; the scheduler runs them in the background
+        for ppt_path in self.ppt_paths:
+            self.scheduler.submit(ppt_path)
+        self.ppt_paths = []
+        self.file_label.setText("No file selected")
+
+    @Slot()
+    def preview_slide(self):
+        job = self.selected_job()
+        ppt_path = job.ppt_path if job is not None else self.preview_ppt_path
+        if not ppt_path:
             QMessageBox.warning(self, "Warning", "Please select a PPTX file first.")
             return
 
         # Disable button to prevent re-entry
-        self.generate_button.setEnabled(False)
-        self.progress_bar.setValue(0)
-        self.status_label.setText("Converting...")
+        self.preview_button.setEnabled(False)
+        self.preview_worker = PreviewWorker(ppt_path, self.slide_spin.value(), self.scheduler)
+        self.preview_worker.progress.connect(self.on_progress)
+        self.preview_worker.finished.connect(self.on_preview_finished)
+        self.preview_worker.error.connect(self.on_preview_error)
+        self.preview_worker.start()
 
-        # Start conversion in background
-        self.worker = ConversionWorker(self.ppt_path)
-        self.worker.progress.connect(self.on_progress)
-        self.worker.finished.connect(self.on_conversion_finished)
-        self.worker.error.connect(self.on_conversion_error)
-        self.worker.start()
+    @Slot(str)
+    def on_preview_finished(self, path: str):
+        self.preview_button.setEnabled(True)
+        self.show_video(path)
+        self.media_player.play()
+        self.play_button.setText("Pause")
 
     @Slot(str)
-    def on_conversion_finished(self, path: str):
-        QMessageBox.information(self, "Success", f"Video generated: {path}")
-        self.generate_button.setEnabled(True)
+    def on_preview_error(self, message: str):
+        QMessageBox.critical(self, "Error", f"Preview failed:\n{message}")
+        self.preview_button.setEnabled(True)
+
+    def selected_job(self):
+        item = self.queue_list.currentItem()
+        return self.scheduler.get(item.data(Qt.UserRole)) if item else None
+
+    def refresh_queue_order(self):
+        # Keep the list in scheduler order (running, then queued, then finished)
+        current = self.selected_job()
+        self.queue_list.blockSignals(True)
+        self.queue_list.clear()
+        self.job_items = {}
+        for job in self.scheduler.jobs():
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, job.id)
+            self.queue_list.addItem(item)
+            self.job_items[job.id] = item
+            self.update_job_item(job)
+            if current is not None and job.id == current.id:
+                self.queue_list.setCurrentItem(item)
+        self.queue_list.blockSignals(False)
+
+    def update_job_item(self, job):
+        item = self.job_items.get(job.id)
+        if item is None:
+            self.refresh_queue_order()
+            return
+        item.setText(f"{job.name} — {job.status} — {job.percent}% {job.message}")
 
+    def job_status_text(self, job):
+        if job.status == RUNNING:
+            return f"{job.name}: {job.message} (ETA {format_eta(job.eta)})"
+        return f"{job.name}: {job.message}"
+
+    @Slot(object)
+    def on_job_updated(self, job):
+        if job.id not in self.job_items or job.status not in (PENDING, RUNNING, PAUSED):
+            self.refresh_queue_order()
+        else:
+            self.update_job_item(job)
+
+        selected = self.selected_job()
+        if selected is None or selected.id == job.id:
+            self.on_progress(job.percent, self.job_status_text(job))
+
+        if job.status == DONE and not self.media_player.is_playing():
+            self.show_video(job.video_path)
+
+    @Slot()
+    def on_job_selected(self, *args):
+        job = self.selected_job()
+        if job is not None:
+            self.on_progress(job.percent, self.job_status_text(job))
+
+    @Slot()
+    def play_job(self, *args):
+        job = self.selected_job()
+        if job is not None and job.status == DONE:
+            self.show_video(job.video_path)
+
+    @Slot()
+    def toggle_pause_job(self):
+        job = self.selected_job()
+        if job is None:
+            return
+        if job.status == PAUSED:
+            self.scheduler.resume(job.id)
+        else:
+            self.scheduler.pause(job.id)
+
+    @Slot()
+    def cancel_job(self):
+        job = self.selected_job()
+        if job is not None:
+            self.scheduler.cancel(job.id)
+
+    def move_job(self, offset):
+        job = self.selected_job()
+        if job is not None and self.scheduler.move(job.id, offset):
+            self.refresh_queue_order()
+
+    @Slot(bool)
+    def toggle_pause_queue(self, paused):
+        if paused:
+            self.scheduler.pause()
+            self.pause_queue_button.setText("Resume Queue")
+        else:
+            self.scheduler.resume()
+            self.pause_queue_button.setText("Pause Queue")
+
+    def show_video(self, path):
         # Load and show video player
         self.load_video(path)
         self.video_frame.show()
@@ -225,10 +338,9 @@ class MainWindow(QMainWindow):
         self.position_slider.show()
         self.update_timer.start()
 
-    @Slot(str)
-    def on_conversion_error(self, message: str):
-        QMessageBox.critical(self, "Error", f"Conversion failed:\n{message}")
-        self.generate_button.setEnabled(True)
+    def closeEvent(self, event):
+        self.scheduler.shutdown()
+        super().closeEvent(event)
         
     def load_video(self, path):
         # On Windows, need to convert path
@@ -283,6 +395,7 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == "__main__":
+    setup_structured_logging()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.showMaximized()
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from ffmpeg_utils import get_ffmpeg_exe
+from random_voice_picker import get_random_voice
+import tracing
+
+SAMPLE_RATE = 16000
+CLASSIFY_SECONDS = 4.0   # every segment is classified on a window of this length from its middle
+GENDER_LABELS = ("Female", "Male", "Child")
+
+
+def load_segment(audio_path, start=None, end=None, sample_rate=SAMPLE_RATE):
+    """
+    Decodes (part of) an audio file to mono float32 at `sample_rate` with ffmpeg.
+    """
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error"]
+    if start is not None:
+        cmd += ["-ss", str(start)]
+    if end is not None:
+        cmd += ["-to", str(end)]
+    cmd += ["-i", audio_path, "-vn", "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not decode {audio_path}: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def classification_window(signal, length):
+    """
+    Cuts the middle `length` samples of a segment; shorter segments are repeated to fill the window
+    so that every window in a batch has the same length without padding it with silence.
+    """
+    if len(signal) == 0:
+        return np.zeros(length, dtype=np.float32)
+    if len(signal) >= length:
+        offset = (len(signal) - length) // 2
+        return signal[offset:offset + length]
+    return np.resize(signal, length)
+
+
+def classify_segments(segments, window_seconds=CLASSIFY_SECONDS):
+    """
+    Default classifier: one batched model forward for a list of segments.
+    Returns (gender, age) per segment.
+    """
+    from gender_classifier import process_batch
+
+    length = int(window_seconds * SAMPLE_RATE)
+    batch = np.stack([classification_window(load_segment(s["audio"], s.get("start"), s.get("end")), length)
+                      for s in segments])
+    predictions = process_batch(batch)
+    return [(GENDER_LABELS[int(np.argmax(row[1:4]))], float(row[0]) * 100) for row in predictions]
+
+
+def edge_synthesize(segment, voice, gender, output_dir):
+    """
+    Default TTS: Bengali Edge TTS through edge_audio_generator, with the speaker's voice.
+    """
+    from edge_audio_generator import generate_edge_voice
+
+    _, audio_path = generate_edge_voice(segment["text"], output_dir, segment["index"], gender=gender.lower(),
+                                        speed=segment.get("speed", 1.0), voice=voice)
+    return audio_path
+
+
+class _StageClock:
+    """
+    Adds up the time workers of one stage spend busy, for the utilization report.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def timed(self, func, *args, items=1):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.busy += time.perf_counter() - started
+                self.items += items
+
+    def report(self, wall):
+        return {"workers": self.workers, "items": self.items, "busy_seconds": round(self.busy, 3),
+                "utilization": round(self.busy / (wall * self.workers), 3) if wall > 0 else 0.0}
+
+
+class DubbingPipeline:
+    """
+    Dubs source segments (dicts with "audio", "text" and optionally "start", "end", "speaker", "speed")
+    with gender-appropriate voices. Segments are classified `batch_size` at a time on a pool of
+    `classify_workers`; as soon as a batch is classified its segments go to `tts_workers` concurrent
+    TTS requests, so the model and the TTS service work at the same time.
+    Every speaker keeps the voice picked for its first classified segment; segments without a
+    speaker label are grouped by predicted gender.
+    """
+
+    def __init__(self, output_dir, batch_size=8, classify_workers=1, tts_workers=4,
+                 classify=classify_segments, synthesize=edge_synthesize):
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.classify_workers = classify_workers
+        self.tts_workers = tts_workers
+        self.classify = classify
+        self.synthesize = synthesize
+        self.speaker_voices = {}
+        self._voice_lock = threading.Lock()
+
+    def voice_for(self, speaker, gender):
+        with self._voice_lock:
+            if speaker not in self.speaker_voices:
+                # There are no child voices; a female voice is the closest match
+                voice_gender = "female" if gender == "Child" else gender
+                self.speaker_voices[speaker] = get_random_voice(voice_gender, exclude=self.speaker_voices.values())
+            return self.speaker_voices[speaker]
+
+    def _dub(self, segment, gender, age):
+        speaker = segment.get("speaker") or gender
+        voice = self.voice_for(speaker, gender)
+        with tracing.span("dub_tts", cat="tts", segment=segment["index"], voice=voice):
+            audio_path = self.synthesize(segment, voice, gender, self.output_dir)
+        return {"index": segment["index"], "speaker": speaker, "gender": gender, "age": round(age, 1),
+                "voice": voice, "audio": audio_path}
+
+    def _classify(self, batch):
+        with tracing.span("classify_batch", cat="model", size=len(batch)):
+            return self.classify(batch)
+
+    def run(self, segments, progress_callback=None):
+        """
+        Returns (results in segment order, report with wall time and utilization of both stages).
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        segments = [dict(segment, index=segment.get("index", i)) for i, segment in enumerate(segments, start=1)]
+        batches = [segments[i:i + self.batch_size] for i in range(0, len(segments), self.batch_size)]
+        classify_clock = _StageClock(self.classify_workers)
+        tts_clock = _StageClock(self.tts_workers)
+
+        started = time.perf_counter()
+        results, failures = {}, {}
+        with ThreadPoolExecutor(self.classify_workers, thread_name_prefix="classify") as classify_pool, \
+                ThreadPoolExecutor(self.tts_workers, thread_name_prefix="tts") as tts_pool:
+            classify_futures = {classify_pool.submit(classify_clock.timed, self._classify, batch, items=len(batch)): batch
+                                for batch in batches}
+            tts_futures = {}
+            # Hand every classified batch to the TTS pool right away; batches finish in any order
+            for future in as_completed(classify_futures):
+                batch = classify_futures[future]
+                try:
+                    labels = future.result()
+                except Exception as e:
+                    for segment in batch:
+                        failures[segment["index"]] = f"classification failed: {e}"
+                    continue
+                for segment, (gender, age) in zip(batch, labels):
+                    tts_futures[tts_pool.submit(tts_clock.timed, self._dub, segment, gender, age)] = segment
+
+            for done, future in enumerate(as_completed(tts_futures), start=1):
+                segment = tts_futures[future]
+                try:
+                    results[segment["index"]] = future.result()
+                except Exception as e:
+                    failures[segment["index"]] = f"TTS failed: {e}"
+                if progress_callback:
+                    progress_callback(int(100 * done / len(segments)), f"Dubbed {done}/{len(segments)}")
+        wall = time.perf_counter() - started
+
+        report = {
+            "segments": len(segments),
+            "failed": {str(index): error for index, error in sorted(failures.items())},
+            "wall_seconds": round(wall, 3),
+            "classify": classify_clock.report(wall),
+            "tts": tts_clock.report(wall),
+            "speakers": dict(self.speaker_voices),
+        }
+        # With both stages overlapped, wall time approaches the busier stage's time per worker
+        report["slowest_stage_seconds"] = round(max(classify_clock.busy / self.classify_workers,
+                                                    tts_clock.busy / self.tts_workers), 3)
+        return [results[index] for index in sorted(results)], report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dub segments with a voice matching each speaker's gender.")
+    parser.add_argument("segments", help='JSON list of {"audio", "text", optional "start", "end", "speaker", "speed"}')
+    parser.add_argument("output_dir", help="Folder for the dubbed audio and dubbing_report.json")
+    parser.add_argument("--batch", type=int, default=8, help="Segments per classification batch")
+    parser.add_argument("--classify-workers", type=int, default=1)
+    parser.add_argument("--tts-workers", type=int, default=4, help="Concurrent TTS requests")
+    parser.add_argument("--trace", default=None, help="Write a Chrome/Perfetto trace of the run to this JSON file")
+    args = parser.parse_args(argv)
+
+    with open(args.segments, "r", encoding="utf-8") as f:
+        segments = json.load(f)
+    if args.trace:
+        tracing.enable()
+    pipeline = DubbingPipeline(args.output_dir, batch_size=args.batch, classify_workers=args.classify_workers,
+                               tts_workers=args.tts_workers)
+    results, report = pipeline.run(segments)
+    if args.trace:
+        tracing.export_chrome_trace(args.trace)
+
+    with open(os.path.join(args.output_dir, "dubbing_report.json"), "w", encoding="utf-8") as f:
+        json.dump({"results": results, "report": report}, f, indent=2, ensure_ascii=False)
+    print(f"Dubbed {len(results)}/{report['segments']} segments in {report['wall_seconds']:.1f}s "
+          f"(classify {report['classify']['utilization']:.0%} busy, tts {report['tts']['utilization']:.0%} busy)")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,7 @@ VOICE_MAPPING = {
     "unknown": "bn-BD-NabanitaNeural"  
 }
 
-def generate_edge_voice(text, audio_folder, index, gender=None, speed=1.0):
+def generate_edge_voice(text, audio_folder, index, gender=None, speed=1.0, voice=None):
     """
     Generate audio using Edge TTS with gender-specific voices.
     
@@ -19,6 +19,7 @@ def generate_edge_voice(text, audio_folder, index, gender=None, speed=1.0):
         audio_folder: Folder to save the audio file
         index: Index number for the audio file
         gender: 'male', 'female', or None (will use default)
+        voice: Edge TTS voice name; overrides the gender-based choice (e.g. to keep one voice per speaker)
     
     Returns:
         AudioSegment object with the generated speech
@@ -26,12 +27,14 @@ def generate_edge_voice(text, audio_folder, index, gender=None, speed=1.0):
     
     print(f"Gender: {gender}")
     # Use gender-specific voice if provided, otherwise use default
-    voice = VOICE_MAPPING.get(gender.lower() if gender else "unknown", VOICE_MAPPING["unknown"])
+    if voice is None:
+        voice = VOICE_MAPPING.get(gender.lower() if gender else "unknown", VOICE_MAPPING["unknown"])
     # voice = get_random_voice(gender)
     print(f"Voice: {voice}")
-    # Create output filename including gender info
+    # Create output filename including gender, voice and speed, so a cached file is only reused for the same speech
     gender_tag = f"_{gender}" if gender else ""
-    audio_path = os.path.join(audio_folder, f"edge_{index}{gender_tag}.mp3")
+    speed_tag = f"_x{speed:g}" if speed != 1.0 else ""
+    audio_path = os.path.join(audio_folder, f"edge_{index}{gender_tag}_{voice}{speed_tag}.mp3")
     
     if os.path.exists(audio_path):
         return AudioSegment.from_file(audio_path), audio_path
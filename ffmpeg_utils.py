@@ -0,0 +1,63 @@
+import os
+import shutil
+import subprocess
+
+
+def get_ffmpeg_exe():
+    """
+    Returns the ffmpeg binary to use: the one bundled with moviepy (imageio-ffmpeg) if available,
+    otherwise the first ffmpeg found on PATH.
+    """
+    try:
+        from imageio_ffmpeg import get_ffmpeg_exe as _bundled_ffmpeg
+        return _bundled_ffmpeg()
+    except Exception:
+        pass
+
+    exe = shutil.which("ffmpeg")
+    if exe is None:
+        raise RuntimeError("ffmpeg not found. Install moviepy (imageio-ffmpeg) or add ffmpeg to PATH.")
+    return exe
+
+
+def run_ffmpeg(args, quiet=True):
+    """
+    Runs ffmpeg with the given argument list (without the executable) and raises RuntimeError
+    with ffmpeg's error output if it fails.
+    """
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-y"]
+    if quiet:
+        cmd += ["-loglevel", "error"]
+    cmd += list(args)
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+    return result
+
+
+def probe_video(path):
+    """
+    Returns (width, height, fps, duration) of a video file without decoding any frames.
+    """
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    infos = ffmpeg_parse_infos(os.path.abspath(path))
+    width, height = infos["video_size"]
+    return int(width), int(height), float(infos["video_fps"]), float(infos["duration"])
+
+
+def concat_videos(video_files, output_video):
+    """
+    Joins videos that share codec parameters with ffmpeg's concat demuxer (stream copy, no re-encode).
+    """
+    list_file = output_video + ".txt"
+    with open(list_file, "w", encoding="utf-8") as f:
+        for path in video_files:
+            escaped = os.path.abspath(path).replace("\\", "/").replace("'", r"'\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy",
+                    "-movflags", "+faststart", output_video])
+    finally:
+        os.remove(list_file)
+    return output_video
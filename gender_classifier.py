@@ -9,6 +9,7 @@ from transformers.models.wav2vec2.modeling_wav2vec2 import (
     Wav2Vec2Model,
     Wav2Vec2PreTrainedModel,
 )
+import tracing
 
 
 class ModelHead(nn.Module):
@@ -87,7 +88,7 @@ def process_func(
     y = torch.from_numpy(y).to(device)
 
     # run through model
-    with torch.no_grad():
+    with torch.no_grad(), tracing.span("model_forward", cat="model", samples=int(y.shape[-1])):
         y = model(y)
         if embeddings:
             y = y[0]
@@ -99,6 +100,23 @@ def process_func(
 
     return y
 
+def process_batch(
+    windows: np.ndarray,
+    sampling_rate: int = sampling_rate,
+) -> np.ndarray:
+    r"""Predict age and gender for a batch of equal-length windows shaped (batch, samples).
+    Returns one row of [age, female, male, child] per window."""
+
+    y = processor(list(windows), sampling_rate=sampling_rate)
+    y = np.stack(y['input_values']).astype(np.float32)
+    y = torch.from_numpy(y).to(device)
+
+    with torch.no_grad(), tracing.span("model_forward", cat="model", batch=int(y.shape[0]), samples=int(y.shape[-1])):
+        _, age, gender = model(y)
+        y = torch.hstack([age, gender])
+
+    return y.detach().cpu().numpy()
+
 def predict_from_audio_path(audio_path, embeddings=False, start_time=None, end_time=None):
     """
     Load audio from file path and predict age and gender
@@ -1,15 +1,18 @@
 import os
 import time
 import shutil
-import numpy as np
-import edge_tts
-from win32com.client import Dispatch, constants, gencache
-from pptx.enum.shapes import MSO_SHAPE_TYPE
-from pptx import Presentation
 import re
-from pydub import AudioSegment
-from moviepy import VideoFileClip, AudioFileClip, AudioClip
+import logging
+import tracing
+# PowerPoint (COM), TTS, numpy, pydub and moviepy are loaded on first use, see backends.py
+import backends
 
+# Per-item detail goes to this logger (see progress.setup_structured_logging); summaries are printed
+logger = logging.getLogger("autonarrate")
+
+DEFAULT_VOICE = "en-US-ChristopherNeural"
+
+@tracing.traced()
 def ppt_to_video(ppt_path: str,
                  video_path: str,
                  use_timings: bool = False,
@@ -17,19 +20,23 @@ def ppt_to_video(ppt_path: str,
                  fps: int = 30,
                  vert_resolution: int = 720,
                  quality: int = 80,
-                 progress_callback=None):
+                 progress_callback=None,
+                 settle_delay: float = 5):
     """
     Exports a PowerPoint presentation to a video file, using either default slide durations or custom timings/narrations.
+    `settle_delay` is how long to wait after quitting PowerPoint before it is started again.
     """
     # Launch PowerPoint (headless)
-    ppt = Dispatch("PowerPoint.Application")
+    with tracing.span("com_launch", cat="com"):
+        ppt = backends.get("powerpoint").Dispatch("PowerPoint.Application")
     # ppt.Visible = False
 
     # Open presentation
     if progress_callback:
         progress_callback(10, "Opening PowerPoint presentation...")
-    pres = ppt.Presentations.Open(os.path.abspath(ppt_path),
-                                  WithWindow=False)
+    with tracing.span("com_open", cat="com"):
+        pres = ppt.Presentations.Open(os.path.abspath(ppt_path),
+                                      WithWindow=False)
 
     # Create video
     if progress_callback:
@@ -47,12 +54,15 @@ def ppt_to_video(ppt_path: str,
     status = pres.CreateVideoStatus
     progress_status = 1
 
-    while status in (1, 2):  # 1=Queued, 2=InProgress
-        if progress_callback:
-            progress_callback(50 + progress_status * 10, "Video generation in progress...")
-        time.sleep(1)
-        status = pres.CreateVideoStatus
-        progress_status += 1
+    with tracing.span("com_export_wait", cat="com") as export_span:
+        while status in (1, 2):  # 1=Queued, 2=InProgress
+            if progress_callback:
+                progress_callback(50 + progress_status * 10, "Video generation in progress...")
+            time.sleep(1)
+            status = pres.CreateVideoStatus
+            progress_status += 1
+        export_span.set(polls=progress_status, status=status)
+    tracing.count_file("bytes_written", video_path)
     # Inspect final status (3=Done, 4=Failed)
     if status == 3:
         if progress_callback:
@@ -66,22 +76,69 @@ def ppt_to_video(ppt_path: str,
     # Clean up
     pres.Close()
     ppt.Quit()
-    time.sleep(5)
+    with tracing.span("com_settle_sleep", cat="com"):
+        time.sleep(settle_delay)
 
 
-def generate_audio_from_points(ppt_path: str, output_dir: str, progress_callback=None):
+def edge_tts_synthesize(text: str, fname: str, voice: str = DEFAULT_VOICE):
+    """
+    Default TTS backend: synthesizes `text` with Edge TTS and saves it as an MP3 file.
+    """
+    communicate = backends.get("edge_tts").Communicate(text, voice)
+    communicate.save_sync(fname)
+
+
+@tracing.traced()
+def generate_audio_from_points(ppt_path: str, output_dir: str, progress_callback=None, slides=None,
+                               synthesize=None, voice: str = DEFAULT_VOICE, batch_slides: bool = False,
+                               presentation=None):
     """
     Generates audio segments for each bullet point or image cue in every slide of a PowerPoint presentation.
     Text content is converted to speech using TTS, while images may result in silent audio segments for timing.
+    If `slides` is given, only those (1-based) slide indices are processed.
+    `presentation` is the already parsed deck, for callers that process it a few slides at a time.
+    `synthesize(text, fname, voice)` replaces the Edge TTS backend, e.g. with an offline engine.
+    With `batch_slides`, each slide's points are narrated with one TTS request and split into the
+    same per-point files (see batched_tts.synthesize_slide), which also records word timings for captions.
     """
-    
+    batch_synthesize = synthesize
+    synthesize = synthesize or edge_tts_synthesize
+
+    def synthesize_points(slide_idx, points):
+        from batched_tts import synthesize_slide
+        try:
+            if synthesize_slide(points, voice, output_dir, slide_idx, synthesize=batch_synthesize):
+                return
+        except AssertionError:
+            pass
+        logger.warning("Could not split slide narration, synthesizing point by point", extra={"slide": slide_idx})
+        for text, fname in points:
+            try:
+                with tracing.span("synthesize", cat="tts", slide=slide_idx, chars=len(text)):
+                    synthesize(text, fname, voice)
+                tracing.count("tts_requests")
+                tracing.count_file("bytes_written", fname)
+            except AssertionError:
+                logger.warning("Skipping invalid TTS text", extra={"slide": slide_idx, "file": fname})
+                audio_map[slide_idx].remove(fname)
+
+    pptx = backends.get("pptx")
+    MSO_SHAPE_TYPE = pptx.enum.shapes.MSO_SHAPE_TYPE
+
     os.makedirs(output_dir, exist_ok=True)
-    prs = Presentation(ppt_path)
+    prs = presentation if presentation is not None else pptx.Presentation(ppt_path)
     slide_count = len(prs.slides)
+    if slides is None:
+        indices = range(1, slide_count + 1)
+    else:
+        indices = sorted(idx for idx in slides if 1 <= idx <= slide_count)
 
     audio_map = {}
-    for slide_idx, slide in enumerate(prs.slides, start=1):
+    for slide_idx in indices:
+        slide = prs.slides[slide_idx - 1]
         audio_map[slide_idx] = []
+        pending_points = []
+        slide_points = []
         point_counter = 1
         image_counter = 0
         percent = int(100 * slide_idx / slide_count)
@@ -89,17 +146,17 @@ def generate_audio_from_points(ppt_path: str, output_dir: str, progress_callback
             progress_callback(percent, f"Generating audio {slide_idx}/{slide_count}")
 
         for shape in slide.shapes:
-            print(f"Shape type of slide {slide_idx}: {shape.shape_type}")
+            logger.debug("Shape", extra={"slide": slide_idx, "shape_type": str(shape.shape_type)})
             if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
                 image_counter += 1
-                print(f"Found image {image_counter} on slide {slide_idx}")
+                logger.debug("Found image", extra={"slide": slide_idx, "image": image_counter})
 
             # if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
             if shape.shape_type == MSO_SHAPE_TYPE.PICTURE and image_counter == 2:
                 # Process the image
-                print(f"Generating silence audio [{slide_idx}]")
                 duration = 4
                 # silent_clip = AudioClip(lambda t: np.array([0.0]), duration=duration)
+                np = backends.get("numpy")
                 def make_silence(t):
                     if np.isscalar(t):
                         return np.zeros((1, 2))  # 1 sample, stereo
@@ -108,10 +165,12 @@ def generate_audio_from_points(ppt_path: str, output_dir: str, progress_callback
                 
                 fname = os.path.join(output_dir, f"slide_{slide_idx}_point_{point_counter}.mp3")
                 if not os.path.exists(fname):
-                    silent_clip = AudioClip(make_silence, duration=duration)
-                    silent_clip.write_audiofile(fname, fps=44100, codec='libmp3lame')
+                    with tracing.span("silence", cat="encode", slide=slide_idx, point=point_counter):
+                        silent_clip = backends.get("moviepy").AudioClip(make_silence, duration=duration)
+                        silent_clip.write_audiofile(fname, fps=44100, codec='libmp3lame')
+                    tracing.count_file("bytes_written", fname)
 
-                print(f"Generated silence audio [{slide_idx}]: {fname}")
+                logger.debug("Generated silence audio", extra={"slide": slide_idx, "file": fname})
                 audio_map[slide_idx].append(fname)
                 point_counter += 1
                 
@@ -123,34 +182,55 @@ def generate_audio_from_points(ppt_path: str, output_dir: str, progress_callback
                 # skip if no alphanumeric content
                 if not text or not re.search(r"\w", text):
                     continue
+                if batch_slides:
+                    fname = os.path.join(output_dir, f"slide_{slide_idx}_point_{point_counter}.mp3")
+                    if not os.path.exists(fname):
+                        pending_points.append((text, fname))
+                    slide_points.append((text, fname))
+                    audio_map[slide_idx].append(fname)
+                    point_counter += 1
+                    continue
                 try:
                     fname = os.path.join(output_dir, f"slide_{slide_idx}_point_{point_counter}.mp3")
                     if not os.path.exists(fname):
-                        communicate = edge_tts.Communicate(text, "en-US-ChristopherNeural")
-                        communicate.save_sync(fname)
+                        with tracing.span("synthesize", cat="tts", slide=slide_idx, point=point_counter, chars=len(text)):
+                            synthesize(text, fname, voice)
+                        tracing.count("tts_requests")
+                        tracing.count_file("bytes_written", fname)
 
-                    print(f"Generated audio: {fname}")
+                    logger.debug("Generated audio", extra={"slide": slide_idx, "point": point_counter, "file": fname})
                     audio_map[slide_idx].append(fname)
                     point_counter += 1
                 except AssertionError:
-                    print(f"⚠️ Skipping invalid TTS text at slide {slide_idx}, point {point_counter}")
+                    logger.warning("Skipping invalid TTS text", extra={"slide": slide_idx, "point": point_counter})
                     continue
+        if pending_points:
+            synthesize_points(slide_idx, pending_points)
+        if slide_points:
+            # Every point's text is recorded, so captions cover clips without word timings too
+            from batched_tts import save_timings
+            save_timings(output_dir, slide_idx, [{"file": os.path.basename(fname), "text": text, "words": []}
+                                                 for text, fname in slide_points])
     return audio_map
 
+@tracing.traced()
 def measure_durations(audio_map, progress_callback=None):
     """
     Calculates the duration (in seconds) of each generated audio segment for every slide.
     Returns a mapping of slide indices to lists of durations.
     """
+    AudioFileClip = backends.get("moviepy").AudioFileClip
     durations = {}
     total_items = sum(len(files) for files in audio_map.values())
     completed = 0
     for slide_idx, files in audio_map.items():
         durs = []
         for path in files:
-            clip = AudioFileClip(path)
-            durs.append(clip.duration)
-            clip.close()
+            with tracing.span("probe", cat="decode", slide=slide_idx):
+                clip = AudioFileClip(path)
+                durs.append(clip.duration)
+                clip.close()
+            tracing.count_file("bytes_read", path)
             completed += 1
             if progress_callback:
                 percent = int(100 * completed / total_items)
@@ -160,17 +240,23 @@ def measure_durations(audio_map, progress_callback=None):
         durations[slide_idx] = durs
     return durations
 
-def apply_point_timings(pptx_path: str, durations_map: dict, progress_callback=None):
+@tracing.traced()
+def apply_point_timings(pptx_path: str, durations_map: dict, progress_callback=None, settle_delay: float = 5):
     """
     Applies precise timing to each bullet point or cue in the PowerPoint presentation,
     ensuring that each appears in sync with its corresponding audio.
     """
 
+    win32 = backends.get("powerpoint")
+    constants = win32.constants
+
     # 1) Start PowerPoint in the background
-    pp = gencache.EnsureDispatch("PowerPoint.Application")
+    with tracing.span("com_launch", cat="com"):
+        pp = win32.gencache.EnsureDispatch("PowerPoint.Application")
     
     # 2) Open your presentation
-    pres = pp.Presentations.Open(os.path.abspath(pptx_path))
+    with tracing.span("com_open", cat="com"):
+        pres = pp.Presentations.Open(os.path.abspath(pptx_path))
 
     # 3) Calculate total points for progress
     total_points = sum(len(durations) for durations in durations_map.values())
@@ -188,7 +274,7 @@ def apply_point_timings(pptx_path: str, durations_map: dict, progress_callback=N
         completed = 0
 
         # — First bullet: appear as soon as the slide opens
-        print(f"Total sequence of slide {idx} is {seq.Count}. Times: {point_durs}")
+        logger.debug("Slide sequence", extra={"slide": idx, "effects": seq.Count, "durations": point_durs})
         if seq.Count >= 1:
             first = seq.Item(1)
             first.Timing.TriggerType      = constants.msoAnimTriggerWithPrevious
@@ -198,7 +284,7 @@ def apply_point_timings(pptx_path: str, durations_map: dict, progress_callback=N
                 percent = int(100 * completed / total_points)
                 progress_callback(percent, f"Applying timing {completed}/{total_points}")
 
-            print(f"Slide {idx} • Point 1: appear {point_durs[0]:.2f}s after previous")
+            logger.debug("Point timing", extra={"slide": idx, "point": 1, "delay": point_durs[0]})
 
         # — Subsequent bullets: appear after the previous point’s audio
         for i in range(2, seq.Count + 1):
@@ -211,7 +297,7 @@ def apply_point_timings(pptx_path: str, durations_map: dict, progress_callback=N
             if progress_callback:
                 percent = int(100 * completed / total_points)
                 progress_callback(percent, f"Applying timing {completed}/{total_points}")
-            print(f"Slide {idx} • Point {i}: appear {prev_dur:.2f}s after previous")
+            logger.debug("Point timing", extra={"slide": idx, "point": i, "delay": prev_dur})
 
         # Optional: if you want the slide itself to advance only after
         # all your points have appeared, sum them up:
@@ -223,22 +309,63 @@ def apply_point_timings(pptx_path: str, durations_map: dict, progress_callback=N
         if progress_callback:
             percent = 100
             progress_callback(percent, f"Timing applied")
-        print(f"Slide {idx}: auto-advance after {total:.2f}s total")
+        logger.debug("Slide auto-advance", extra={"slide": idx, "advance_time": total})
 
     # 4) Save and clean up
-    pres.Save()
-    time.sleep(5)
+    with tracing.span("com_save", cat="com"):
+        pres.Save()
+    with tracing.span("com_settle_sleep", cat="com"):
+        time.sleep(settle_delay)
     pres.Close()
     pp.Quit()
     
     print("Done: per-point timings applied.")
 
 
+def extract_slides(ppt_path: str, slide_indices, output_path: str):
+    """
+    Saves a copy of the presentation that contains only the given (1-based) slides, in their original order.
+    """
+    prs = backends.get("pptx").Presentation(ppt_path)
+    extract_slide_groups(prs, [(slide_indices, output_path)])
+    return output_path
+
+
+def extract_slide_groups(prs, groups):
+    """
+    Saves several copies of one parsed presentation, each with only some of its slides, from a
+    list of (1-based slide indices, output path). The other slides are taken out of the slide
+    list and the package for each save and put back afterwards, so the deck is parsed only once.
+    """
+    slide_id_list = prs.slides._sldIdLst
+    slide_ids = list(slide_id_list)
+    rels = prs.part.rels
+    for slide_indices, output_path in groups:
+        keep = set(slide_indices)
+        removed = []
+        for idx, slide_id in enumerate(slide_ids, start=1):
+            if idx not in keep:
+                removed.append((slide_id.rId, rels.pop(slide_id.rId)))
+                slide_id_list.remove(slide_id)
+        try:
+            prs.save(output_path)
+        finally:
+            for r_id, rel in removed:
+                rels._rels[r_id] = rel
+            for slide_id in list(slide_id_list):
+                slide_id_list.remove(slide_id)
+            for slide_id in slide_ids:
+                slide_id_list.append(slide_id)
+    return [output_path for _, output_path in groups]
+
+
 # --- combine & merge utilities ---
-def combine_audio(audio_map, output_audio, progress_callback=None):
+@tracing.traced()
+def combine_audio(audio_map, output_audio, progress_callback=None, format="mp3"):
     """
     Flattens and concatenates all generated audio clips into a single audio file, preserving the order of slides and points.
     """
+    AudioSegment = backends.get("pydub").AudioSegment
     combined = AudioSegment.empty()
     total_items = sum(len(files) for files in audio_map.values())
     completed = 0
@@ -248,29 +375,39 @@ def combine_audio(audio_map, output_audio, progress_callback=None):
             if progress_callback:
                 percent = int(100 * completed / total_items)
                 progress_callback(percent, f"Combining audio {completed}/{total_items}")
-            combined += AudioSegment.from_file(fpath)
-    combined.export(output_audio, format="mp3")
+            with tracing.span("decode", cat="decode", slide=slide_idx):
+                combined += AudioSegment.from_file(fpath)
+            tracing.count_file("bytes_read", fpath)
+    with tracing.span("encode", cat="encode", seconds=len(combined) / 1000):
+        combined.export(output_audio, format=format)
+    tracing.count_file("bytes_written", output_audio)
     if progress_callback:
         progress_callback(100, "Combining audio completed.")
     print(f"🔊 Combined audio saved to {output_audio}")
     return output_audio
 
+@tracing.traced()
 def merge_audio_video(video_path, audio_path, output_video="final_video.mp4", progress_callback=None):
     """
     Overlays the combined audio track onto the generated video, producing a final video with synchronized narration.
     """
     if progress_callback:
         progress_callback(10, "Loading video ...")
-    video = VideoFileClip(video_path)
+    moviepy = backends.get("moviepy")
+    video = moviepy.VideoFileClip(video_path)
     if progress_callback:
         progress_callback(20, "Loading audio...")
-    audio = AudioFileClip(audio_path)
+    audio = moviepy.AudioFileClip(audio_path)
     if progress_callback:
         progress_callback(30, "Merging video and audio...")
     final = video.with_audio(audio)
     if progress_callback:
         progress_callback(60, "Saving final video...")
-    final.write_videofile(output_video, codec="libx264", audio_codec="aac")
+    with tracing.span("encode", cat="encode", seconds=video.duration):
+        final.write_videofile(output_video, codec="libx264", audio_codec="aac")
+    tracing.count_file("bytes_read", video_path)
+    tracing.count_file("bytes_read", audio_path)
+    tracing.count_file("bytes_written", output_video)
     if progress_callback:
         progress_callback(100, "Video merge completed.")
     print(f"🎬 Merged video saved to {output_video}")
@@ -0,0 +1,492 @@
+import os
+import glob
+import time
+import shutil
+import itertools
+import threading
+from contextlib import contextmanager
+
+from progress import ProgressTracker, StageCostHistory
+import tracing
+
+from generate_video import (
+    generate_audio_from_points,
+    measure_durations,
+    apply_point_timings,
+    ppt_to_video,
+    combine_audio,
+    merge_audio_video
+)
+from chunked_pipeline import generate_audio_in_windows, concat_audio_chunks, mux_audio_video, SpilledClips
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Returned by a stage whose output already existed, so its (near zero) time is not a real cost
+SKIPPED = "skipped"
+
+# How many stages may use each resource at the same time, across all jobs.
+# "tts" is network bound (edge-tts), "render" drives PowerPoint over COM and "encode" runs ffmpeg.
+DEFAULT_LIMITS = {"tts": 3, "render": 1, "encode": 2}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's thread when the job is cancelled."""
+
+
+class ConversionJob:
+    """
+    One PowerPoint-to-video conversion, split into stages that each declare the resource they use.
+    With `force`, outputs of a previous conversion of the deck are discarded first.
+    With `window`, the narration is processed `window` slides at a time with intermediate results
+    spilled to disk, which keeps memory flat for very large decks.
+    With `use_arena`, cues are decoded once into a PCM arena: durations come from its index and
+    the narration is written losslessly as WAV, so the only lossy encode left is the final mux.
+    With `segment_store` (a segment_store.SegmentStore), slides already rendered for any deck are
+    reused from the store; the others are narrated, rendered together in one deck and added to it.
+    With `batch_tts`, each slide is narrated with one TTS request and SRT captions are written
+    from the word timings (not with `segment_store`, whose reused segments have no captions).
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, ppt_path: str, force: bool = False, window: int = None, use_arena: bool = False,
+                 segment_store=None, batch_tts: bool = False):
+        if window and use_arena:
+            raise ValueError("The windowed mode and the audio arena cannot be combined")
+        if segment_store is not None and (window or use_arena):
+            raise ValueError("The segment store cannot be combined with the windowed mode or the audio arena")
+        if segment_store is not None and batch_tts:
+            raise ValueError("The segment store cannot write captions; it cannot be combined with batched TTS")
+        self.id = next(self._ids)
+        self.ppt_path = ppt_path
+        video_file_name = os.path.splitext(os.path.basename(self.ppt_path))[0]
+        parent_dir = os.path.dirname(os.path.abspath(self.ppt_path))
+        self.name = video_file_name
+        self.video_dir = os.path.join(parent_dir, video_file_name)
+
+        if not os.path.exists(self.video_dir):
+            os.makedirs(self.video_dir)
+
+        self.video_path = os.path.join(self.video_dir, video_file_name + ".mp4")
+        self.ppt_video_path = os.path.join(self.video_dir, video_file_name + "_ppt.mp4")
+        self.audio_dir = os.path.join(self.video_dir, "audio")
+        self.combined_audio_file = os.path.join(self.video_dir, "combined_audio.mp3")
+        self.force = force
+        self.window = window
+        self.audio_chunks = None
+        self.use_arena = use_arena
+        self.arena_path = os.path.join(self.video_dir, "audio_arena.pcm")
+        self.arena = None
+        if use_arena:
+            self.combined_audio_file = os.path.join(self.video_dir, "combined_audio.wav")
+        self.segment_store = segment_store
+        self.store_conversion = None
+        self.batch_tts = batch_tts
+        self.captions_file = os.path.join(self.video_dir, video_file_name + ".srt")
+
+        self.status = PENDING
+        self.stage = None
+        self.percent = 0
+        self.eta = None
+        self.message = "Queued"
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stage_timings = {}
+        self.skipped_stages = set()
+        self.audio_map = None
+        self.durations_map = None
+        self.clips_map = None
+
+        self._cancelled = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._holding = None    # resource whose slot the running stage holds
+
+    def stages(self):
+        """
+        Returns the pipeline as (stage name, resource, callable) in execution order.
+        """
+        if self.segment_store is not None:
+            return [
+                ("audio", "tts", self.run_store_audio),
+                ("video", "render", self.run_store_video),
+                ("merge", "encode", self.run_store_merge),
+            ]
+        return [
+            ("audio", "tts", self.run_audio),
+            ("timing", "render", self.run_timing),
+            ("video", "render", self.run_video),
+            ("combine", "encode", self.run_combine),
+            ("merge", "encode", self.run_merge),
+        ]
+
+    def checkpoint(self):
+        """
+        Called between items: blocks while the job is paused and aborts it once cancelled.
+        """
+        self._resumed.wait()
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def close(self):
+        """
+        Releases what the stages keep open (the on-disk durations and clips stores of the windowed mode,
+        the pinned segments of the segment store), whether the job finished, failed or was cancelled.
+        """
+        if self.window and self.durations_map is not None:
+            self.durations_map.close()
+        if self.clips_map is not None:
+            self.clips_map.close()
+        if self.store_conversion is not None:
+            self.store_conversion.close()
+            self.store_conversion = None
+
+    def clear_outputs(self):
+        for path in (self.video_path, self.ppt_video_path, self.combined_audio_file, self.captions_file):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(self.audio_dir, ignore_errors=True)
+        shutil.rmtree(os.path.join(self.video_dir, "audio_chunks"), ignore_errors=True)
+        shutil.rmtree(os.path.join(self.video_dir, "segments"), ignore_errors=True)
+        for path in glob.glob(os.path.join(self.video_dir, "durations.db*")) + \
+                glob.glob(os.path.join(self.video_dir, "clips.db*")) + \
+                glob.glob(self.arena_path + "*"):
+            os.remove(path)
+
+    def run_audio(self, progress_callback):
+        if self.force:
+            self.clear_outputs()
+        if self.window:
+            if self.batch_tts:
+                self.clips_map = SpilledClips(os.path.join(self.video_dir, "clips.db"))
+            self.durations_map, self.audio_chunks = generate_audio_in_windows(
+                self.ppt_path, self.video_dir, self.window, progress_callback=progress_callback,
+                batch_slides=self.batch_tts, clips=self.clips_map)
+            if self.batch_tts:
+                # Captions follow the clips each window measured, not whatever is in the audio folder
+                from batched_tts import write_srt
+                write_srt(self.clips_map, self.durations_map, self.captions_file)
+                self.clips_map.close()
+            return
+        self.audio_map = generate_audio_from_points(self.ppt_path, self.audio_dir, progress_callback=progress_callback,
+                                                    batch_slides=self.batch_tts)
+        if self.use_arena:
+            from audio_arena import AudioArena
+            self.arena = AudioArena.from_audio_map(self.audio_map, self.arena_path, progress_callback=progress_callback)
+            self.durations_map = self.arena.durations_map()
+        else:
+            self.durations_map = measure_durations(self.audio_map, progress_callback=progress_callback)
+        if self.batch_tts:
+            from batched_tts import write_srt
+            write_srt(self.audio_map, self.durations_map, self.captions_file)
+
+    def run_timing(self, progress_callback):
+        for attempt in range(3):
+            try:
+                apply_point_timings(self.ppt_path, self.durations_map, progress_callback=progress_callback)
+                break  # Success, exit the retry loop
+            except JobCancelled:
+                raise
+            except Exception as e:
+                if attempt == 2:
+                    raise RuntimeError(f"Video generation failed during point timing: {e}")
+                progress_callback(0, f"Retrying point timing due to error: {e} (attempt {attempt + 2}/3)")
+
+    def run_video(self, progress_callback):
+        if os.path.exists(self.ppt_video_path):
+            return SKIPPED
+        ppt_to_video(self.ppt_path, self.ppt_video_path, use_timings=True, default_slide_duration=7,
+                     progress_callback=progress_callback)
+
+    def run_combine(self, progress_callback):
+        if self.window:
+            self.durations_map.close()
+        if os.path.exists(self.combined_audio_file):
+            return SKIPPED
+        if self.window:
+            concat_audio_chunks(self.audio_chunks, self.combined_audio_file)
+        elif self.use_arena:
+            self.arena.export(self.combined_audio_file)
+        else:
+            combine_audio(self.audio_map, self.combined_audio_file, progress_callback=progress_callback)
+
+    def run_store_audio(self, progress_callback):
+        if self.force:
+            self.clear_outputs()
+        if os.path.exists(self.video_path):
+            return SKIPPED
+        from segment_store import StoreConversion
+        # Work files go to the store, not next to the deck, where a recursive watch would pick them up
+        self.store_conversion = StoreConversion(self.ppt_path, self.video_path, self.segment_store)
+        if not self.store_conversion.narrate(progress_callback=progress_callback):
+            return SKIPPED
+
+    def run_store_video(self, progress_callback):
+        if self.store_conversion is None or not self.store_conversion.render(progress_callback=progress_callback):
+            return SKIPPED
+
+    def run_store_merge(self, progress_callback):
+        if self.store_conversion is None:
+            return SKIPPED
+        self.store_conversion.assemble(progress_callback=progress_callback)
+
+    def run_merge(self, progress_callback):
+        if os.path.exists(self.video_path):
+            return SKIPPED
+        if self.window:
+            mux_audio_video(self.ppt_video_path, self.combined_audio_file, self.video_path)
+        else:
+            merge_audio_video(self.ppt_video_path, self.combined_audio_file, self.video_path,
+                              progress_callback=progress_callback)
+
+
+class JobScheduler:
+    """
+    Runs queued conversions concurrently.
+    Up to `max_jobs` jobs are active at once; each stage waits for a slot of its resource,
+    so one deck can synthesize speech while another is rendered or encoded.
+    `on_update(job)` is called from worker threads whenever a job changes; progress updates
+    are coalesced to at most `max_update_rate` per second per job.
+    """
+
+    def __init__(self, limits=None, max_jobs=3, on_update=None, max_update_rate=4.0, cost_history=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.max_jobs = max_jobs
+        self.on_update = on_update
+        self.max_update_rate = max_update_rate
+        self.cost_history = cost_history or StageCostHistory()
+        self._slots = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+        self._pending = []
+        self._active = []
+        self._finished = []
+        self._paused = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    # --- queue management ---
+    def submit(self, ppt_path: str, force: bool = False, window: int = None, use_arena: bool = False,
+               segment_store=None, batch_tts: bool = False) -> ConversionJob:
+        job = ConversionJob(ppt_path, force=force, window=window, use_arena=use_arena, segment_store=segment_store,
+                            batch_tts=batch_tts)
+        with self._cond:
+            self._pending.append(job)
+            self._cond.notify_all()
+        self._notify(job)
+        return job
+
+    def jobs(self):
+        with self._cond:
+            return list(self._active) + list(self._pending) + list(self._finished)
+
+    def get(self, job_id):
+        for job in self.jobs():
+            if job.id == job_id:
+                return job
+        return None
+
+    def move(self, job_id, offset: int):
+        """
+        Moves a pending job `offset` places towards the front (negative) or back (positive) of the queue.
+        """
+        with self._cond:
+            for i, job in enumerate(self._pending):
+                if job.id == job_id:
+                    new_index = min(max(i + offset, 0), len(self._pending) - 1)
+                    self._pending.insert(new_index, self._pending.pop(i))
+                    return True
+        return False
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status in (DONE, FAILED, CANCELLED):
+            return False
+        job._cancelled.set()
+        job._resumed.set()
+        with self._cond:
+            if job in self._pending:
+                self._pending.remove(job)
+                self._finish(job, CANCELLED, "Cancelled")
+        return True
+
+    def pause(self, job_id=None):
+        """
+        Pauses one job, or the whole queue when no id is given (no new jobs start and active jobs hold).
+        A running job stops at its next item boundary.
+        """
+        with self._cond:
+            targets = [self.get(job_id)] if job_id is not None else list(self._active)
+            if job_id is None:
+                self._paused = True
+            changed = [job for job in targets if job is not None and job.status in (PENDING, RUNNING)]
+            for job in changed:
+                job._resumed.clear()
+                job.status = PAUSED
+            self._cond.notify_all()
+        for job in changed:
+            self._notify(job)
+
+    def resume(self, job_id=None):
+        # State and events change under the lock before waiters are woken, so the dispatcher
+        # cannot wake up, still see the job paused and miss the wakeup
+        with self._cond:
+            targets = [self.get(job_id)] if job_id is not None else list(self._active) + list(self._pending)
+            if job_id is None:
+                self._paused = False
+            changed = [job for job in targets if job is not None and job.status == PAUSED]
+            for job in changed:
+                job.status = RUNNING if job in self._active else PENDING
+                job._resumed.set()
+            self._cond.notify_all()
+        for job in changed:
+            self._notify(job)
+
+    def wait(self):
+        """
+        Blocks until the queue is empty and no job is running.
+        """
+        with self._cond:
+            while self._pending or self._active:
+                self._cond.wait()
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.jobs():
+                self.cancel(job.id)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @contextmanager
+    def resource(self, name):
+        """
+        Holds one slot of a resource, e.g. to use PowerPoint outside a queued job.
+        """
+        slot = self._slots[name]
+        slot.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    # --- internals ---
+    def _notify(self, job):
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"⚠️ Job update callback failed: {e}")
+
+    def _finish(self, job, status, message, error=None):
+        job.finished_at = time.time()
+        job.status = status
+        job.message = message
+        job.error = error
+        self._finished.append(job)
+        self._cond.notify_all()
+        self._notify(job)
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while not self._closed:
+                pending = [job for job in self._pending if job._resumed.is_set()]
+                if self._paused or not pending or len(self._active) >= self.max_jobs:
+                    self._cond.wait()
+                    continue
+                job = pending[0]
+                self._pending.remove(job)
+                self._active.append(job)
+                threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.id}", daemon=True).start()
+
+    def _acquire(self, job, resource):
+        slot = self._slots[resource]
+        while not slot.acquire(timeout=0.5):
+            job.checkpoint()
+        job._holding = resource
+
+    def _release(self, job):
+        if job._holding is not None:
+            self._slots[job._holding].release()
+            job._holding = None
+
+    def _checkpoint(self, job):
+        """
+        Like job.checkpoint(), but a job paused mid-stage gives its resource slot back while it
+        waits, so other jobs can use it, and takes a slot again when it is resumed.
+        """
+        resource = job._holding
+        if resource is not None and not job._resumed.is_set():
+            self._release(job)
+            job.checkpoint()
+            self._acquire(job, resource)
+        job.checkpoint()
+
+    def _run_job(self, job):
+        com_initialized = False
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+            com_initialized = True
+        except ImportError:
+            pass
+
+        status, message, error = DONE, "Done", None
+        job.status = RUNNING
+        job.started_at = time.time()
+        stages = job.stages()
+        tracker = ProgressTracker(self.cost_history.weights([stage for stage, _, _ in stages]),
+                                  on_update=lambda p, m, eta: self._on_tracker_update(job, p, m, eta),
+                                  max_rate=self.max_update_rate,
+                                  context={"job": job.id, "deck": job.name})
+        try:
+            for stage, resource, run in stages:
+                job.checkpoint()
+                job.stage = stage
+                tracker.start_stage(stage, f"Waiting for {resource}...")
+
+                self._acquire(job, resource)
+                started = time.perf_counter()
+                try:
+                    # PowerPoint stages are only interrupted between stages, so COM is never left mid-export
+                    interruptible = resource != "render"
+                    with tracing.span(stage, cat="job", job=job.name):
+                        outcome = run(lambda p, m, stage=stage: self._on_progress(job, tracker, stage, p, m, interruptible))
+                finally:
+                    self._release(job)
+                    job.stage_timings[stage] = time.perf_counter() - started
+                if outcome == SKIPPED:
+                    job.skipped_stages.add(stage)
+            tracker.finish()
+            self.cost_history.record({stage: seconds for stage, seconds in job.stage_timings.items()
+                                      if stage not in job.skipped_stages})
+        except JobCancelled:
+            status, message = CANCELLED, "Cancelled"
+        except Exception as e:
+            status, message, error = FAILED, f"Failed: {e}", str(e)
+        finally:
+            job.close()
+            if com_initialized:
+                pythoncom.CoUninitialize()
+
+        with self._cond:
+            self._active.remove(job)
+            self._finish(job, status, message, error)
+
+    def _on_progress(self, job, tracker, stage, percent, message, interruptible=True):
+        if interruptible:
+            self._checkpoint(job)
+        tracker.update(percent, f"{stage.capitalize()}: {message}")
+
+    def _on_tracker_update(self, job, percent, message, eta):
+        job.percent = percent
+        job.message = message
+        job.eta = eta
+        self._notify(job)
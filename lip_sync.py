@@ -0,0 +1,232 @@
+import os
+import re
+import glob
+import shlex
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ffmpeg_utils import concat_videos
+
+# Command templates for the external lip-sync models (see wav2lip.txt and SadTalker.txt).
+# Placeholders: {face}, {audio}, {output} (file to write) and {output_dir} (directory the model may write into).
+WAV2LIP_COMMAND = ("python inference.py --face {face} --audio {audio} "
+                   "--checkpoint_path checkpoints/wav2lip_gan.pth --outfile {output}")
+SADTALKER_COMMAND = ("python inference.py --driven_audio {audio} --source_image {face} "
+                     "--result_dir {output_dir} --enhancer gfpgan")
+# Folders inside the model checkout that the models write to at fixed paths (Wav2Lip: temp/result.avi)
+PRIVATE_DIRS = ("temp",)
+
+
+def load_audio_map(audio_dir):
+    """
+    Rebuilds the audio_map of generate_audio_from_points from the slide_<n>_point_<m>.mp3 files in a folder.
+    """
+    pattern = re.compile(r"slide_(\d+)_point_(\d+)\.mp3$")
+    points = {}
+    for path in glob.glob(os.path.join(audio_dir, "slide_*_point_*.mp3")):
+        match = pattern.search(os.path.basename(path))
+        if match:
+            points.setdefault(int(match.group(1)), []).append((int(match.group(2)), path))
+    return {slide_idx: [path for _, path in sorted(files)] for slide_idx, files in sorted(points.items())}
+
+
+def chunk_key(audio_files, face_image, command):
+    """
+    Cache key of one lip-sync chunk: hash of the slide's audio, the face image and the command.
+    """
+    digest = hashlib.sha256()
+    for path in list(audio_files) + [face_image]:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    digest.update(" ".join(command if isinstance(command, (list, tuple)) else [command]).encode())
+    return digest.hexdigest()[:32]
+
+
+def write_chunk_audio(audio_files, output_wav):
+    """
+    Concatenates one slide's narration clips into a WAV file for the lip-sync model.
+    """
+    from pydub import AudioSegment
+
+    combined = AudioSegment.empty()
+    for path in audio_files:
+        combined += AudioSegment.from_file(path)
+    combined.export(output_wav, format="wav")
+    return output_wav
+
+
+def _build_command(command, **values):
+    if isinstance(command, str):
+        command = shlex.split(command, posix=os.name != "nt")
+    return [arg.format(**values) for arg in command]
+
+
+def _link(source, target):
+    """
+    Links `source` to `target`: a symbolic link, or where Windows does not allow one, a directory
+    junction or a hard link (a copy for files on another volume).
+    """
+    is_dir = os.path.isdir(source)
+    try:
+        os.symlink(source, target, target_is_directory=is_dir)
+        return
+    except OSError:
+        if os.name != "nt":
+            raise
+    if is_dir:
+        import _winapi
+        _winapi.CreateJunction(source, target)
+    else:
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+def make_chunk_cwd(model_dir, parent_dir, private_dirs=PRIVATE_DIRS):
+    """
+    Creates a working directory for one chunk that mirrors the model checkout `model_dir`: every
+    entry is linked in, except `private_dirs`, which are created empty. Models that write to
+    fixed relative paths (Wav2Lip's temp/result.avi) can then run several chunks at once.
+    """
+    chunk_cwd = tempfile.mkdtemp(prefix="lipsync_cwd_", dir=parent_dir)
+    for name in os.listdir(model_dir):
+        if name not in private_dirs:
+            _link(os.path.join(os.path.abspath(model_dir), name), os.path.join(chunk_cwd, name))
+    for name in private_dirs:
+        os.makedirs(os.path.join(chunk_cwd, name), exist_ok=True)
+    return chunk_cwd
+
+
+def run_lip_sync_chunk(command, face_image, audio_wav, output_video, cwd=None, timeout=None,
+                       private_dirs=PRIVATE_DIRS):
+    """
+    Runs the external lip-sync command for one chunk. The result is written to a scratch
+    directory first and moved into place only on success, so a failed or interrupted run
+    never leaves a partial file in the cache.
+    The command runs in its own copy of the model directory `cwd` (default: the current directory,
+    see make_chunk_cwd), so concurrent chunks do not overwrite each other's intermediate files.
+    """
+    parent_dir = os.path.dirname(output_video)
+    scratch_dir = tempfile.mkdtemp(prefix="lipsync_", dir=parent_dir)
+    chunk_cwd = None
+    try:
+        chunk_cwd = make_chunk_cwd(cwd or os.getcwd(), parent_dir, private_dirs)
+        scratch_video = os.path.join(scratch_dir, "result.mp4")
+        args = _build_command(command, face=os.path.abspath(face_image), audio=os.path.abspath(audio_wav),
+                              output=scratch_video, output_dir=scratch_dir)
+        result = subprocess.run(args, cwd=chunk_cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                timeout=timeout)
+        if result.returncode != 0:
+            tail = result.stdout.decode(errors="replace").strip()[-2000:]
+            raise RuntimeError(f"Lip-sync command failed ({result.returncode}): {tail}")
+
+        if not os.path.exists(scratch_video):
+            # Models such as SadTalker pick their own file name inside the result directory
+            produced = sorted(glob.glob(os.path.join(scratch_dir, "**", "*.mp4"), recursive=True), key=os.path.getmtime)
+            if not produced:
+                raise RuntimeError("Lip-sync command finished without producing a video")
+            scratch_video = produced[-1]
+        os.replace(scratch_video, output_video)
+        return output_video
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        if chunk_cwd:
+            shutil.rmtree(chunk_cwd, ignore_errors=True)
+
+
+def generate_lip_sync(audio_map, face_image, output_video, work_dir,
+                      command=WAV2LIP_COMMAND, cwd=None, max_workers=2,
+                      retries=1, timeout=None, progress_callback=None, private_dirs=PRIVATE_DIRS):
+    """
+    Generates the lip-sync overlay track slide by slide.
+    The narration is split at slide boundaries, each chunk runs the external lip-sync command
+    in a bounded pool, finished chunks are cached by content hash under work_dir, and the
+    chunks are stitched into one video. Rerunning after a failure only redoes missing chunks.
+    Every chunk runs in its own mirror of the model directory `cwd` in which `private_dirs` are
+    not shared (see make_chunk_cwd).
+    """
+    chunk_dir = os.path.join(work_dir, "lip_sync_chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    chunks = []
+    for slide_idx in sorted(audio_map):
+        files = audio_map[slide_idx]
+        if not files:
+            continue
+        key = chunk_key(files, face_image, command)
+        chunks.append((slide_idx, files, os.path.join(chunk_dir, f"slide_{slide_idx}_{key}.mp4")))
+
+    pending = [chunk for chunk in chunks if not os.path.exists(chunk[2])]
+    print(f"Lip-sync: {len(chunks) - len(pending)}/{len(chunks)} chunks cached, {len(pending)} to generate")
+
+    def render(slide_idx, files, chunk_video):
+        audio_wav = chunk_video[:-4] + ".wav"
+        write_chunk_audio(files, audio_wav)
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    return run_lip_sync_chunk(command, face_image, audio_wav, chunk_video, cwd=cwd, timeout=timeout,
+                                              private_dirs=private_dirs)
+                except (RuntimeError, subprocess.TimeoutExpired) as e:
+                    if attempt == retries:
+                        raise
+                    print(f"⚠️ Retrying lip-sync for slide {slide_idx}: {e}")
+        finally:
+            os.remove(audio_wav)
+
+    failures = {}
+    completed = len(chunks) - len(pending)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(render, *chunk): chunk[0] for chunk in pending}
+        for future in as_completed(futures):
+            slide_idx = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failures[slide_idx] = str(e)
+                print(f"❌ Lip-sync failed for slide {slide_idx}: {e}")
+            completed += 1
+            if progress_callback:
+                progress_callback(int(90 * completed / max(1, len(chunks))),
+                                  f"Lip-sync chunk {completed}/{len(chunks)}")
+
+    if failures:
+        raise RuntimeError(f"Lip-sync failed for slides {sorted(failures)}; rerun to retry only those chunks")
+
+    if progress_callback:
+        progress_callback(90, "Stitching lip-sync chunks...")
+    concat_videos([chunk[2] for chunk in chunks], output_video)
+    if progress_callback:
+        progress_callback(100, "Lip-sync completed.")
+    print(f"🗣️ Lip-sync video saved to {output_video}")
+    return output_video
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a lip-sync overlay track slide by slide.")
+    parser.add_argument("audio_dir", help="Folder with the slide_<n>_point_<m>.mp3 narration clips")
+    parser.add_argument("face_image", help="Face image for the lip-sync model")
+    parser.add_argument("output_video", help="Path of the stitched lip-sync video")
+    parser.add_argument("--command", default=WAV2LIP_COMMAND, help="Lip-sync command template")
+    parser.add_argument("--cwd", default=None,
+                        help="Lip-sync model checkout; every chunk runs in its own linked copy of it")
+    parser.add_argument("--workers", type=int, default=2, help="Number of chunks generated in parallel")
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds allowed per chunk")
+    args = parser.parse_args(argv)
+
+    audio_map = load_audio_map(args.audio_dir)
+    work_dir = os.path.dirname(os.path.abspath(args.output_video))
+    generate_lip_sync(audio_map, args.face_image, args.output_video, work_dir,
+                      command=args.command, cwd=args.cwd, max_workers=args.workers,
+                      retries=args.retries, timeout=args.timeout)
+
+
+if __name__ == "__main__":
+    main()
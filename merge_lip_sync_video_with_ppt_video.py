@@ -1,31 +1,206 @@
-from moviepy import VideoFileClip, CompositeVideoClip
-
-# 1. Load your two clips
-ppt_clip     = VideoFileClip("What_is_Robot.mp4")
-lipsync_clip = VideoFileClip("result_voice.mp4")
-
-# 2. Resize/position the lip-sync window
-#    e.g. make it 25% of the width and put it in the top-right corner
-overlay = (
-    lipsync_clip
-      .resized(width=ppt_clip.w * 0.25)            # scale to 25% of PPT width
-      .with_position(("right", "top"))             # top-right, with no margin
-      .with_duration(lipsync_clip.duration)            # ensure same duration
-)
-
-# 3. Composite them
-final = CompositeVideoClip([ppt_clip, overlay])
-
-# 4. (Optional) If your lip-sync clip already _has_ the audio you want,
-#    MoviePy will pick it up automatically.  Otherwise you can explicitly set:
-# final = final.set_audio(lipsync_clip.audio)
-
-# 5. Export
-final.write_videofile(
-    "What is Robot.mp4",
-    fps=ppt_clip.fps,
-    codec="libx264",
-    audio_codec="aac",
-    preset="medium",
-    threads=4
-)
+import os
+import argparse
+import tempfile
+
+from ffmpeg_utils import run_ffmpeg, probe_video
+
+POSITIONS = ("top-left", "top-right", "bottom-left", "bottom-right", "center")
+
+
+def overlay_geometry(main_size, overlay_size, position="top-right", scale=0.25, margin=0):
+    """
+    Computes where the lip-sync window goes on the slide video.
+    The overlay is scaled to `scale` of the main video width (keeping its aspect ratio)
+    and returns (x, y, width, height), with even dimensions as required by yuv420p.
+    """
+    if position not in POSITIONS:
+        raise ValueError(f"Unknown position '{position}', expected one of {POSITIONS}")
+    main_w, main_h = main_size
+    ov_w, ov_h = overlay_size
+
+    width = max(2, int(main_w * scale) // 2 * 2)
+    height = max(2, int(round(width * ov_h / ov_w)) // 2 * 2)
+    if width > main_w or height > main_h:
+        raise ValueError(f"Overlay {width}x{height} does not fit in {main_w}x{main_h}")
+
+    if position == "center":
+        x, y = (main_w - width) // 2, (main_h - height) // 2
+    else:
+        vertical, horizontal = position.split("-")
+        x = margin if horizontal == "left" else main_w - width - margin
+        y = margin if vertical == "top" else main_h - height - margin
+    return max(0, x), max(0, y), width, height
+
+
+def create_circle_mask(width, height, mask_path):
+    """
+    Writes a grayscale PNG with a white disc (the visible part of the overlay) on black.
+    """
+    from PIL import Image, ImageDraw
+
+    diameter = min(width, height)
+    left, top = (width - diameter) // 2, (height - diameter) // 2
+    mask = Image.new("L", (width, height), 0)
+    ImageDraw.Draw(mask).ellipse((left, top, left + diameter - 1, top + diameter - 1), fill=255)
+    mask.save(mask_path)
+    return mask_path
+
+
+def overlay_with_ffmpeg(ppt_video, lipsync_video, output_video, geometry, circular=False,
+                        audio_source="main", preset="veryfast", audio_codec="copy", threads=None):
+    """
+    Composites the lip-sync clip onto the slide video with a single native ffmpeg filter graph:
+    one decode of each input, one encode of the output, no frames pass through Python.
+    """
+    x, y, width, height = geometry
+    inputs = ["-i", ppt_video, "-i", lipsync_video]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if circular:
+            # The mask is a still image looped for the length of the overlay and merged as its alpha plane
+            _, _, _, overlay_duration = probe_video(lipsync_video)
+            mask_path = create_circle_mask(width, height, os.path.join(tmp_dir, "mask.png"))
+            inputs += ["-loop", "1", "-t", f"{overlay_duration:.3f}", "-i", mask_path]
+            graph = (
+                f"[1:v]scale={width}:{height},format=yuva420p[ov_rgb];"
+                f"[2:v]format=gray[ov_mask];"
+                f"[ov_rgb][ov_mask]alphamerge[ov];"
+            )
+        else:
+            graph = f"[1:v]scale={width}:{height}[ov];"
+        graph += f"[0:v][ov]overlay=x={x}:y={y}:eof_action=pass,format=yuv420p[v]"
+
+        audio_input = "0" if audio_source == "main" else "1"
+        args = inputs + [
+            "-filter_complex", graph,
+            "-map", "[v]", "-map", f"{audio_input}:a?",
+            "-c:v", "libx264", "-preset", preset,
+            "-c:a", audio_codec,
+            "-movflags", "+faststart",
+        ]
+        if threads:
+            args += ["-threads", str(threads)]
+        run_ffmpeg(args + [output_video])
+    return output_video
+
+
+def overlay_with_numpy(ppt_video, lipsync_video, output_video, geometry, circular=False,
+                       audio_source="main", preset="veryfast", threads=None, progress_callback=None):
+    """
+    Fallback compositor for ffmpeg builds without the needed filters.
+    The overlay is resized by the decoder, and each frame is composited in place into one
+    preallocated buffer with a precomputed boolean mask (no per-frame clip objects).
+    """
+    import numpy as np
+    from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+    from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+    x, y, width, height = geometry
+    main_reader = FFMPEG_VideoReader(ppt_video)
+    overlay_reader = FFMPEG_VideoReader(lipsync_video, target_resolution=(width, height))
+    main_w, main_h = main_reader.size
+
+    mask = None
+    if circular:
+        rows, cols = np.ogrid[:height, :width]
+        radius = min(width, height) / 2
+        mask = np.hypot(rows - (height - 1) / 2, cols - (width - 1) / 2) <= radius
+        mask = mask[..., None]
+
+    frame = np.empty((main_h, main_w, 3), dtype=np.uint8)
+    region = frame[y:y + height, x:x + width]
+    n_frames = main_reader.n_frames
+    fps = main_reader.fps
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        silent_video = os.path.join(tmp_dir, "composited.mp4")
+        writer = FFMPEG_VideoWriter(silent_video, (main_w, main_h), fps,
+                                    codec="libx264", preset=preset, threads=threads)
+        try:
+            for i in range(n_frames):
+                t = i / fps
+                np.copyto(frame, main_reader.get_frame(t))
+                if t < overlay_reader.duration:
+                    overlay = overlay_reader.get_frame(t)
+                    if mask is None:
+                        region[...] = overlay
+                    else:
+                        np.copyto(region, overlay, where=mask)
+                writer.write_frame(frame)
+                if progress_callback and i % max(1, int(fps)) == 0:
+                    progress_callback(int(100 * i / n_frames), f"Compositing frame {i}/{n_frames}")
+        finally:
+            writer.close()
+            main_reader.close()
+            overlay_reader.close()
+
+        audio_file = ppt_video if audio_source == "main" else lipsync_video
+        run_ffmpeg(["-i", silent_video, "-i", audio_file,
+                    "-map", "0:v", "-map", "1:a?", "-c", "copy",
+                    "-movflags", "+faststart", output_video])
+    return output_video
+
+
+def overlay_lip_sync(ppt_video, lipsync_video, output_video,
+                     position="top-right", scale=0.25, margin=0, circular=False,
+                     audio_source="main", preset="veryfast", threads=None,
+                     backend="auto", progress_callback=None):
+    """
+    Places the lip-sync (talking head) video on top of the slide video.
+    `backend` is "ffmpeg" (single-pass filter graph), "numpy" (frame compositor) or "auto",
+    which tries ffmpeg first and falls back to the NumPy compositor if the filter graph fails.
+    """
+    if audio_source not in ("main", "overlay"):
+        raise ValueError("audio_source must be 'main' or 'overlay'")
+
+    main_w, main_h, _, _ = probe_video(ppt_video)
+    overlay_w, overlay_h, _, _ = probe_video(lipsync_video)
+    geometry = overlay_geometry((main_w, main_h), (overlay_w, overlay_h), position, scale, margin)
+
+    if progress_callback:
+        progress_callback(10, "Compositing lip-sync overlay...")
+
+    if backend in ("auto", "ffmpeg"):
+        try:
+            overlay_with_ffmpeg(ppt_video, lipsync_video, output_video, geometry, circular,
+                                audio_source, preset, threads=threads)
+        except RuntimeError as e:
+            if backend == "ffmpeg":
+                raise
+            print(f"⚠️ ffmpeg overlay failed, falling back to NumPy compositor: {e}")
+            backend = "numpy"
+    if backend == "numpy":
+        overlay_with_numpy(ppt_video, lipsync_video, output_video, geometry, circular,
+                           audio_source, preset, threads, progress_callback)
+    elif backend not in ("auto", "ffmpeg"):
+        raise ValueError(f"Unknown backend '{backend}'")
+
+    if progress_callback:
+        progress_callback(100, "Lip-sync overlay completed.")
+    print(f"🎬 Lip-sync video saved to {output_video}")
+    return output_video
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Overlay a lip-sync video on a slide video.")
+    parser.add_argument("ppt_video", help="Slide video exported from PowerPoint")
+    parser.add_argument("lipsync_video", help="Lip-sync (talking head) video")
+    parser.add_argument("output_video", help="Path of the composited video")
+    parser.add_argument("--position", choices=POSITIONS, default="top-right")
+    parser.add_argument("--scale", type=float, default=0.25, help="Overlay width as a fraction of the slide width")
+    parser.add_argument("--margin", type=int, default=0, help="Distance in pixels from the edges")
+    parser.add_argument("--circle", action="store_true", help="Crop the overlay to a circle")
+    parser.add_argument("--audio", choices=("main", "overlay"), default="main", help="Which input provides the audio track")
+    parser.add_argument("--preset", default="veryfast", help="x264 preset")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--backend", choices=("auto", "ffmpeg", "numpy"), default="auto")
+    args = parser.parse_args(argv)
+
+    overlay_lip_sync(args.ppt_video, args.lipsync_video, args.output_video,
+                     position=args.position, scale=args.scale, margin=args.margin,
+                     circular=args.circle, audio_source=args.audio, preset=args.preset,
+                     threads=args.threads, backend=args.backend)
+
+
+if __name__ == "__main__":
+    main()
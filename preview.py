@@ -0,0 +1,93 @@
+import os
+import glob
+import shutil
+import hashlib
+from contextlib import nullcontext
+
+from generate_video import (
+    generate_audio_from_points,
+    measure_durations,
+    apply_point_timings,
+    ppt_to_video,
+    combine_audio,
+    extract_slides,
+    DEFAULT_VOICE
+)
+from ffmpeg_utils import run_ffmpeg
+import backends
+
+PREVIEW_FPS = 10
+PREVIEW_RESOLUTION = 240
+PREVIEW_QUALITY = 50
+
+
+def slide_cues_key(ppt_path, slide_index, voice=DEFAULT_VOICE):
+    """
+    Hash of one slide's XML and the voice, so an edited slide never plays narration made for its old text.
+    """
+    prs = backends.get("pptx").Presentation(ppt_path)
+    if not 1 <= slide_index <= len(prs.slides):
+        raise ValueError(f"Slide {slide_index} does not exist in {os.path.basename(ppt_path)}")
+    digest = hashlib.sha256(prs.slides[slide_index - 1].part.blob)
+    digest.update(voice.encode())
+    return digest.hexdigest()[:16]
+
+
+def generate_slide_preview(ppt_path: str,
+                           slide_index: int,
+                           fps: int = PREVIEW_FPS,
+                           vert_resolution: int = PREVIEW_RESOLUTION,
+                           render_slot=nullcontext,
+                           progress_callback=None):
+    """
+    Renders a quick, low-resolution narrated clip of one slide to check its timing.
+    Only that slide's cues are synthesized, into a folder keyed by the slide's content (reused
+    until the slide is edited), and PowerPoint exports a one-slide copy of the deck, so the
+    original file is left untouched.
+    `render_slot` is a context manager factory held while PowerPoint is in use.
+    """
+    video_file_name = os.path.splitext(os.path.basename(ppt_path))[0]
+    video_dir = os.path.join(os.path.dirname(os.path.abspath(ppt_path)), video_file_name)
+    preview_dir = os.path.join(video_dir, "preview")
+    os.makedirs(preview_dir, exist_ok=True)
+
+    slide_pptx = os.path.join(preview_dir, f"slide_{slide_index}.pptx")
+    slide_video = os.path.join(preview_dir, f"slide_{slide_index}_video.mp4")
+    slide_audio = os.path.join(preview_dir, f"slide_{slide_index}_audio.mp3")
+    preview_path = os.path.join(preview_dir, f"slide_{slide_index}_preview.mp4")
+    for path in (slide_video, slide_audio, preview_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    if progress_callback:
+        progress_callback(5, f"Generating audio for slide {slide_index}...")
+    audio_dir = os.path.join(preview_dir, f"slide_{slide_index}_cues_{slide_cues_key(ppt_path, slide_index)}")
+    # Cues made for earlier versions of the slide are stale
+    for stale_dir in glob.glob(os.path.join(preview_dir, f"slide_{slide_index}_cues_*")):
+        if stale_dir != audio_dir:
+            shutil.rmtree(stale_dir, ignore_errors=True)
+    audio_map = generate_audio_from_points(ppt_path, audio_dir, slides={slide_index})
+    durations = measure_durations(audio_map)[slide_index]
+
+    if progress_callback:
+        progress_callback(30, "Rendering slide...")
+    extract_slides(ppt_path, [slide_index], slide_pptx)
+    with render_slot():
+        apply_point_timings(slide_pptx, {1: durations}, settle_delay=0)
+        ppt_to_video(slide_pptx, slide_video, use_timings=True, fps=fps,
+                     vert_resolution=vert_resolution, quality=PREVIEW_QUALITY, settle_delay=0)
+
+    if progress_callback:
+        progress_callback(80, "Adding narration...")
+    preview_audio = {1: audio_map[slide_index]}
+    if preview_audio[1]:
+        combine_audio(preview_audio, slide_audio)
+        # The video stream is copied as is; only the short audio track is encoded
+        run_ffmpeg(["-i", slide_video, "-i", slide_audio, "-map", "0:v", "-map", "1:a",
+                    "-c:v", "copy", "-c:a", "aac", preview_path])
+    else:
+        os.replace(slide_video, preview_path)
+
+    if progress_callback:
+        progress_callback(100, "Preview ready.")
+    return preview_path
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger("autonarrate")
+
+# Share of total conversion time per stage, used until real timings have been recorded
+DEFAULT_STAGE_WEIGHTS = {"audio": 0.35, "timing": 0.10, "video": 0.35, "combine": 0.05, "merge": 0.15}
+APP_DIR = os.path.join(os.path.expanduser("~"), ".autonarrate")
+STAGE_COSTS_FILE = os.path.join(APP_DIR, "stage_costs.json")
+LOG_FILE = os.path.join(APP_DIR, "autonarrate.log")
+
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line, including any `extra` fields.
+    """
+    _standard = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self._standard})
+        return json.dumps(entry, default=str)
+
+
+def setup_structured_logging(log_file=LOG_FILE, level=logging.DEBUG):
+    """
+    Sends the per-item detail of every stage to a JSON-lines log file instead of stdout or the UI.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    handler = logging.FileHandler(log_file, encoding="utf-8")
+    handler.setFormatter(JsonLogFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return handler
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "estimating..."
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class StageCostHistory:
+    """
+    Keeps a moving average of each stage's share of total conversion time, persisted between runs.
+    """
+
+    def __init__(self, path=STAGE_COSTS_FILE, smoothing=0.3):
+        self.path = path
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._shares = dict(DEFAULT_STAGE_WEIGHTS)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._shares.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def weights(self, stages):
+        with self._lock:
+            shares = [max(self._shares.get(stage, 0.0), 1e-3) for stage in stages]
+        total = sum(shares)
+        return {stage: share / total for stage, share in zip(stages, shares)}
+
+    def record(self, stage_timings):
+        """
+        Folds the measured seconds per stage of a finished conversion into the averages.
+        Stages that did not run keep their share; the measured ones split the share they held between them.
+        """
+        total = sum(stage_timings.values())
+        if total <= 0:
+            return
+        with self._lock:
+            mass = sum(self._shares.get(stage, 0.0) for stage in stage_timings) or 1.0
+            for stage, seconds in stage_timings.items():
+                share = mass * seconds / total
+                old = self._shares.get(stage, share)
+                self._shares[stage] = (1 - self.smoothing) * old + self.smoothing * share
+            shares = dict(self._shares)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(shares, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not save stage costs", extra={"error": str(e)})
+
+
+class ProgressTracker:
+    """
+    Turns per-stage 0-100% callbacks into one weighted 0-100% value with an ETA.
+    Every update is logged at debug level; `on_update(percent, message, eta_seconds)` is called
+    at most `max_rate` times per second, plus once for every stage change and at completion.
+    """
+
+    def __init__(self, weights, on_update, max_rate=4.0, context=None, clock=time.monotonic):
+        self.weights = weights
+        self.on_update = on_update
+        self.min_interval = 1.0 / max_rate
+        self.context = context or {}
+        self.clock = clock
+        self.started = clock()
+        self.percent = 0.0
+        self.eta = None
+        self._completed_weight = 0.0
+        self._stage = None
+        self._last_emit = None
+
+    def start_stage(self, stage, message=None):
+        if self._stage is not None:
+            self._completed_weight += self.weights.get(self._stage, 0.0)
+        self._stage = stage
+        self._report(0, message or f"Starting {stage}...", force=True)
+
+    def update(self, percent, message):
+        self._report(percent, message, force=percent >= 100)
+
+    def finish(self, message="Done"):
+        self._completed_weight = 1.0
+        self._stage = None
+        self.percent = 100.0
+        self.eta = 0.0
+        self._emit(message)
+
+    def _report(self, percent, message, force=False):
+        stage_weight = self.weights.get(self._stage, 0.0)
+        fraction = min(1.0, self._completed_weight + stage_weight * min(max(percent, 0), 100) / 100)
+        # Never move the bar backwards, e.g. when a stage retries
+        self.percent = max(self.percent, 100 * fraction)
+
+        elapsed = self.clock() - self.started
+        done = self.percent / 100
+        self.eta = elapsed * (1 - done) / done if done >= 0.02 else None
+
+        logger.debug(message, extra=dict(self.context, stage=self._stage, stage_percent=percent,
+                                         overall_percent=round(self.percent, 1)))
+
+        now = self.clock()
+        if force or self._last_emit is None or now - self._last_emit >= self.min_interval:
+            self._emit(message)
+
+    def _emit(self, message):
+        self._last_emit = self.clock()
+        self.on_update(int(self.percent), message, self.eta)
@@ -14,15 +14,16 @@ for v in voices:
     g = v["gender"].lower()
     voices_by_gender.setdefault(g, []).append(v["name"])
 
-def get_random_voice(gender: str) -> str:
+def get_random_voice(gender: str, exclude=()) -> str:
     """
-    Return a random voice name for the given gender.
+    Return a random voice name for the given gender, preferring voices not in `exclude`.
     Raises ValueError if no voices for that gender.
     """
     g = gender.lower()
     if g not in voices_by_gender or not voices_by_gender[g]:
         raise ValueError(f"No voices available for gender '{gender}'")
-    return random.choice(voices_by_gender[g])
+    unused = [name for name in voices_by_gender[g] if name not in exclude]
+    return random.choice(unused or voices_by_gender[g])
 
 # 3) example usage
 if __name__ == "__main__":
@@ -0,0 +1,456 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import socket
+import shutil
+import argparse
+import importlib
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from generate_video import extract_slide_groups, DEFAULT_VOICE
+from ffmpeg_utils import concat_videos
+import backends
+
+# Shard states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_PORT = 8765
+TOKEN_HEADER = "X-Render-Token"
+TOKEN_ENV = "AUTONARRATE_CLUSTER_TOKEN"
+_LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def _safe_worker(name):
+    # Worker names come from the network; they are only used in logs and bookkeeping
+    return re.sub(r"[^\w.-]", "_", str(name or "unknown"))[:64]
+
+
+class Shard:
+    def __init__(self, shard_id, slides, deck_path):
+        self.id = shard_id
+        self.slides = slides
+        self.deck_path = deck_path
+        self.state = QUEUED
+        self.attempts = 0
+        self.worker = None
+        self.last_heartbeat = 0.0
+        self.segment_path = None
+        self.error = None
+
+
+class Coordinator:
+    """
+    Splits a deck into shards of `shard_size` slides and hands them out to render workers over HTTP.
+    Workers lease a shard, send heartbeats while rendering it and upload the finished segment.
+    A shard whose worker stops sending heartbeats for `lease_timeout` seconds, or reports a failure,
+    goes back to the queue (up to `max_attempts` times). Once every shard is done, the segments
+    are joined in slide order into the final video.
+    The coordinator only listens on localhost unless given another `host`; it then requires a shared
+    `token`, which every worker request must carry in the X-Render-Token header.
+    """
+
+    def __init__(self, ppt_path, output_video, work_dir=None, shard_size=1, host="127.0.0.1", port=DEFAULT_PORT,
+                 lease_timeout=60.0, max_attempts=3, settings=None, token=None):
+        if host not in _LOOPBACK_HOSTS and not token:
+            raise ValueError(f"Listening on {host} needs a shared token, so that only your workers can lease shards")
+        self.ppt_path = ppt_path
+        self.output_video = output_video
+        self.work_dir = work_dir or os.path.splitext(os.path.abspath(output_video))[0] + "_shards"
+        self.shard_size = shard_size
+        self.host = host
+        self.port = port
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.token = token
+        self.settings = dict({"voice": DEFAULT_VOICE}, **(settings or {}))
+        self.shards = []
+        self._lock = threading.Condition()
+        self._server = None
+
+    # --- shard bookkeeping ---
+    def prepare(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        prs = backends.get("pptx").Presentation(self.ppt_path)
+        slide_count = len(prs.slides)
+        for shard_id, start in enumerate(range(1, slide_count + 1, self.shard_size)):
+            slides = list(range(start, min(start + self.shard_size, slide_count + 1)))
+            self.shards.append(Shard(shard_id, slides, os.path.join(self.work_dir, f"shard_{shard_id:05d}.pptx")))
+        extract_slide_groups(prs, [(shard.slides, shard.deck_path) for shard in self.shards])
+        print(f"Split {slide_count} slides into {len(self.shards)} shards")
+
+    def finished(self):
+        return all(shard.state == DONE for shard in self.shards) or self.failed_shards()
+
+    def failed_shards(self):
+        return [shard for shard in self.shards if shard.state == FAILED]
+
+    def lease(self, worker):
+        with self._lock:
+            self._expire_leases()
+            for shard in self.shards:
+                if shard.state == QUEUED:
+                    shard.state = LEASED
+                    shard.worker = worker
+                    shard.attempts += 1
+                    shard.last_heartbeat = time.monotonic()
+                    print(f"Shard {shard.id} (slides {shard.slides[0]}-{shard.slides[-1]}) -> {worker} "
+                          f"(attempt {shard.attempts})", flush=True)
+                    return shard
+        return None
+
+    def heartbeat(self, worker, shard_id):
+        with self._lock:
+            shard = self.shards[shard_id]
+            if shard.state != LEASED or shard.worker != worker:
+                return False
+            shard.last_heartbeat = time.monotonic()
+            return True
+
+    def complete(self, worker, shard_id, uploaded_path, segment_path):
+        with self._lock:
+            shard = self.shards[shard_id]
+            if shard.state in (DONE, FAILED):
+                os.remove(uploaded_path)
+                return False
+            # A late result from an expired lease is still a valid segment
+            os.replace(uploaded_path, segment_path)
+            shard.state = DONE
+            shard.segment_path = segment_path
+            shard.worker = worker
+            print(f"Shard {shard.id} done by {worker}", flush=True)
+            self._lock.notify_all()
+            return True
+
+    def fail(self, worker, shard_id, error):
+        with self._lock:
+            shard = self.shards[shard_id]
+            if shard.state == LEASED and shard.worker == worker:
+                self._requeue(shard, f"failed on {worker}: {error}")
+
+    def _requeue(self, shard, reason):
+        shard.error = reason
+        shard.worker = None
+        if shard.attempts >= self.max_attempts:
+            shard.state = FAILED
+            print(f"❌ Shard {shard.id} {reason}; giving up after {shard.attempts} attempts", flush=True)
+        else:
+            shard.state = QUEUED
+            print(f"⚠️ Shard {shard.id} {reason}; requeued", flush=True)
+        self._lock.notify_all()
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for shard in self.shards:
+            if shard.state == LEASED and now - shard.last_heartbeat > self.lease_timeout:
+                self._requeue(shard, f"lost (no heartbeat from {shard.worker})")
+
+    def status(self):
+        with self._lock:
+            counts = {}
+            for shard in self.shards:
+                counts[shard.state] = counts.get(shard.state, 0) + 1
+            return {"deck": os.path.basename(self.ppt_path), "shards": len(self.shards), "states": counts}
+
+    # --- serving ---
+    def run(self):
+        """
+        Prepares the shards, serves workers until all shards are done, and writes the final video.
+        """
+        self.prepare()
+        handler = type("CoordinatorHandler", (_CoordinatorHandler,), {"coordinator": self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self.port = self._server.server_address[1]
+        server_thread = threading.Thread(target=self._server.serve_forever, name="coordinator-http", daemon=True)
+        server_thread.start()
+        print(f"🛰️ Coordinator listening on {self.host}:{self.port}", flush=True)
+
+        try:
+            with self._lock:
+                while not self.finished():
+                    self._lock.wait(timeout=1.0)
+                    self._expire_leases()
+        finally:
+            # Keep answering briefly so polling workers learn that the job is over
+            time.sleep(1.0)
+            self._server.shutdown()
+            self._server.server_close()
+
+        failed = self.failed_shards()
+        if failed:
+            raise RuntimeError(f"Rendering failed for shards {[shard.id for shard in failed]}: {failed[0].error}")
+
+        concat_videos([shard.segment_path for shard in self.shards], self.output_video)
+        print(f"🎬 Final video saved to {self.output_video}")
+        return self.output_video
+
+
+class _CoordinatorHandler(BaseHTTPRequestHandler):
+    coordinator = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, code, payload=None):
+        body = json.dumps(payload or {}).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _authorized(self):
+        token = self.coordinator.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode(), token.encode()):
+            self._send_json(401, {"error": "missing or wrong token"})
+            return False
+        return True
+
+    def _shard_id(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        shard_id = int(parts[1])
+        if not 0 <= shard_id < len(self.coordinator.shards):
+            raise ValueError(shard_id)
+        return shard_id, parts[2]
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/status":
+            return self._send_json(200, self.coordinator.status())
+        try:
+            shard_id, action = self._shard_id()
+        except (ValueError, IndexError):
+            return self._send_json(404)
+        if action != "deck":
+            return self._send_json(404)
+        deck_path = self.coordinator.shards[shard_id].deck_path
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(deck_path)))
+        self.end_headers()
+        with open(deck_path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        coordinator = self.coordinator
+        if self.path == "/lease":
+            worker = _safe_worker(self._read_json().get("worker"))
+            shard = coordinator.lease(worker)
+            if shard is not None:
+                return self._send_json(200, {"shard": shard.id, "slides": shard.slides, "attempt": shard.attempts,
+                                             "settings": coordinator.settings})
+            return self._send_json(410 if coordinator.finished() else 204)
+        try:
+            shard_id, action = self._shard_id()
+        except (ValueError, IndexError):
+            return self._send_json(404)
+        payload = self._read_json()
+        worker = _safe_worker(payload.get("worker"))
+        if action == "heartbeat":
+            ok = coordinator.heartbeat(worker, shard_id)
+            return self._send_json(200 if ok else 409)
+        if action == "failed":
+            coordinator.fail(worker, shard_id, payload.get("error", "unknown error"))
+            return self._send_json(200)
+        return self._send_json(404)
+
+    def do_PUT(self):
+        if not self._authorized():
+            return
+        try:
+            shard_id, action = self._shard_id()
+        except (ValueError, IndexError):
+            return self._send_json(404)
+        if action != "segment":
+            return self._send_json(404)
+        query = dict(part.split("=", 1) for part in self.path.partition("?")[2].split("&") if "=" in part)
+        worker = _safe_worker(urllib.request.unquote(query.get("worker", "unknown")))
+
+        coordinator = self.coordinator
+        segment_path = os.path.join(coordinator.work_dir, f"segment_{shard_id:05d}.mp4")
+        # Named from the shard alone, never from what the client sent
+        tmp_path = f"{segment_path}.{uuid.uuid4().hex}.part"
+        remaining = int(self.headers.get("Content-Length", 0))
+        with open(tmp_path, "wb") as f:
+            while remaining > 0:
+                block = self.rfile.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+        if remaining:
+            os.remove(tmp_path)
+            return self._send_json(400, {"error": "incomplete upload"})
+        accepted = coordinator.complete(worker, shard_id, tmp_path, segment_path)
+        return self._send_json(200 if accepted else 409)
+
+
+class RenderWorker:
+    """
+    Leases shards from a coordinator, renders them with `render(deck_path, output_video, work_dir=..., **settings)`
+    and uploads the segments. Heartbeats are sent from a background thread while a shard renders.
+    `token` is the coordinator's shared token, if it has one.
+    """
+
+    def __init__(self, coordinator_url, worker_id=None, work_dir=None, render=None,
+                 heartbeat_interval=5.0, poll_interval=2.0, exit_when_done=True, token=None):
+        if render is None:
+            from segments import render_segment
+            render = render_segment
+        self.url = coordinator_url.rstrip("/")
+        self.worker_id = _safe_worker(worker_id or f"{socket.gethostname()}-{os.getpid()}")
+        self.work_dir = work_dir or os.path.join(os.path.abspath("render_worker"), self.worker_id)
+        self.render = render
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.exit_when_done = exit_when_done
+        self.token = token
+
+    def _request(self, method, path, payload=None, data=None, headers=None, timeout=30):
+        if payload is not None:
+            data = json.dumps(payload).encode()
+            headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        if self.token:
+            headers = dict(headers or {}, **{TOKEN_HEADER: self.token})
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def run(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        print(f"🛠️ Worker {self.worker_id} polling {self.url}", flush=True)
+        while True:
+            try:
+                status, body = self._request("POST", "/lease", {"worker": self.worker_id})
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(self.poll_interval)
+                continue
+            if status == 200:
+                self.process(json.loads(body))
+            elif status == 410 and self.exit_when_done:
+                print(f"Worker {self.worker_id}: no more shards, exiting", flush=True)
+                return
+            else:
+                time.sleep(self.poll_interval)
+
+    def process(self, lease):
+        shard_id = lease["shard"]
+        shard_dir = os.path.join(self.work_dir, f"shard_{shard_id:05d}_{lease['attempt']}")
+        os.makedirs(shard_dir, exist_ok=True)
+        deck_path = os.path.join(shard_dir, "deck.pptx")
+        segment_path = os.path.join(shard_dir, "segment.mp4")
+
+        stop = threading.Event()
+
+        def send_heartbeats():
+            while not stop.wait(self.heartbeat_interval):
+                try:
+                    status, _ = self._request("POST", f"/shards/{shard_id}/heartbeat", {"worker": self.worker_id})
+                    if status == 409:
+                        print(f"⚠️ Lease on shard {shard_id} was lost; finishing anyway", flush=True)
+                except (urllib.error.URLError, ConnectionError, socket.timeout):
+                    pass
+
+        heartbeat = threading.Thread(target=send_heartbeats, name=f"heartbeat-{shard_id}", daemon=True)
+        heartbeat.start()
+        try:
+            status, body = self._request("GET", f"/shards/{shard_id}/deck", timeout=120)
+            if status != 200:
+                raise RuntimeError(f"Could not download shard {shard_id} ({status})")
+            with open(deck_path, "wb") as f:
+                f.write(body)
+
+            self.render(deck_path, segment_path, work_dir=os.path.join(shard_dir, "work"), **lease["settings"])
+
+            with open(segment_path, "rb") as f:
+                query = urllib.request.quote(self.worker_id)
+                status, _ = self._request("PUT", f"/shards/{shard_id}/segment?worker={query}", data=f,
+                                          headers={"Content-Length": str(os.path.getsize(segment_path)),
+                                                   "Content-Type": "video/mp4"}, timeout=600)
+            print(f"Shard {shard_id} uploaded ({'accepted' if status == 200 else 'duplicate'})", flush=True)
+        except Exception as e:
+            print(f"❌ Shard {shard_id} failed: {e}", flush=True)
+            try:
+                self._request("POST", f"/shards/{shard_id}/failed", {"worker": self.worker_id, "error": str(e)})
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+        finally:
+            stop.set()
+            heartbeat.join()
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+def load_renderer(spec):
+    """
+    Resolves "module:function" to a render callable, e.g. to use a stub renderer when testing on localhost.
+    """
+    module_name, _, function_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), function_name or "render_segment")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a deck across several machines.")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Shard a deck and assemble the final video")
+    coordinator_parser.add_argument("deck", help="PPTX file")
+    coordinator_parser.add_argument("output_video", help="Final MP4")
+    coordinator_parser.add_argument("--host", default="127.0.0.1",
+                                    help="Interface to listen on, e.g. 0.0.0.0 for remote workers (needs a token)")
+    coordinator_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coordinator_parser.add_argument("--shard-size", type=int, default=1, help="Slides per shard")
+    coordinator_parser.add_argument("--lease-timeout", type=float, default=60.0,
+                                    help="Seconds without heartbeat before a shard is given to another worker")
+    coordinator_parser.add_argument("--max-attempts", type=int, default=3)
+    coordinator_parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                                    help=f"Shared secret workers must send (default: ${TOKEN_ENV})")
+    coordinator_parser.add_argument("--voice", default=DEFAULT_VOICE)
+    coordinator_parser.add_argument("--fps", type=int, default=30)
+    coordinator_parser.add_argument("--resolution", type=int, default=720, help="Vertical resolution")
+
+    worker_parser = subparsers.add_parser("worker", help="Render shards for a coordinator")
+    worker_parser.add_argument("coordinator_url", help="e.g. http://render-host:8765")
+    worker_parser.add_argument("--id", default=None, help="Worker name (default: host-pid)")
+    worker_parser.add_argument("--work-dir", default=None)
+    worker_parser.add_argument("--heartbeat", type=float, default=5.0, help="Seconds between heartbeats")
+    worker_parser.add_argument("--renderer", default="segments:render_segment", help="module:function that renders a shard")
+    worker_parser.add_argument("--forever", action="store_true", help="Keep polling after the deck is finished")
+    worker_parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                               help=f"Shared secret of the coordinator (default: ${TOKEN_ENV})")
+    args = parser.parse_args(argv)
+    if args.role == "coordinator" and args.host not in _LOOPBACK_HOSTS and not args.token:
+        parser.error(f"--host {args.host} needs --token (or ${TOKEN_ENV}) so that only your workers can connect")
+
+    if args.role == "coordinator":
+        settings = {"voice": args.voice, "fps": args.fps, "vert_resolution": args.resolution}
+        Coordinator(args.deck, args.output_video, shard_size=args.shard_size, host=args.host, port=args.port,
+                    lease_timeout=args.lease_timeout, max_attempts=args.max_attempts, settings=settings,
+                    token=args.token).run()
+    else:
+        RenderWorker(args.coordinator_url, worker_id=args.id, work_dir=args.work_dir,
+                     render=load_renderer(args.renderer), heartbeat_interval=args.heartbeat,
+                     exit_when_done=not args.forever, token=args.token).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
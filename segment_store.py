@@ -0,0 +1,506 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from generate_video import (
+    generate_audio_from_points,
+    measure_durations,
+    apply_point_timings,
+    ppt_to_video,
+    combine_audio,
+    extract_slides,
+    DEFAULT_VOICE
+)
+from chunked_pipeline import CHUNK_SAMPLE_RATE
+from ffmpeg_utils import concat_videos, run_ffmpeg
+import tracing
+import backends
+
+STORE_VERSION = 2   # bump when the format of stored segments changes, so stale segments are never reused
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".autonarrate", "segments")
+# A lease older than this was left by a process that died without releasing it
+LEASE_TIMEOUT = 24 * 3600
+
+_RID = re.compile(rb'"(rId\d+)"')
+# PowerPoint stamps every slide with a random id, which differs between copies of the same slide
+_CREATION_ID = re.compile(rb"<p14:creationId\b[^>]*/>")
+
+
+def _part_digest(part, memo):
+    """
+    Hashes a package part together with everything it references (images, media, layout, master, theme).
+    Relationship ids are replaced by the digest of their target, so the same slide hashes the same
+    whichever deck it sits in.
+    """
+    if part.partname in memo:
+        return memo[part.partname]
+    memo[part.partname] = b"cycle"
+    constants = backends.get("pptx").opc.constants
+    RT, CT = constants.RELATIONSHIP_TYPE, constants.CONTENT_TYPE
+    # Relationships that do not change how a slide looks or sounds (and would pull in the rest of the deck)
+    skipped_rels = {RT.NOTES_SLIDE, RT.SLIDE, RT.NOTES_MASTER}
+
+    rel_digests = {}
+    for rId, rel in part.rels.items():
+        if rel.reltype in skipped_rels:
+            continue
+        if rel.reltype == RT.SLIDE_LAYOUT and part.content_type == CT.PML_SLIDE_MASTER:
+            continue  # a master lists all its layouts; only the one a slide uses matters
+        if rel.is_external:
+            rel_digests[rId] = hashlib.sha256(rel.target_ref.encode()).hexdigest().encode()
+        else:
+            rel_digests[rId] = _part_digest(rel.target_part, memo)
+
+    blob = part.blob
+    if part.content_type.endswith("xml"):
+        blob = _CREATION_ID.sub(b"", blob)
+        blob = _RID.sub(lambda m: b'"' + rel_digests.get(m.group(1).decode(), m.group(1)) + b'"', blob)
+
+    digest = hashlib.sha256(part.content_type.encode())
+    digest.update(blob)
+    for rId in sorted(rel_digests):
+        digest.update(rel_digests[rId])
+    memo[part.partname] = digest.hexdigest().encode()
+    return memo[part.partname]
+
+
+def slide_keys(ppt_path, voice=DEFAULT_VOICE, fps=30, vert_resolution=720, tts_backend="edge_tts"):
+    """
+    Returns the store key of every slide in order: a hash of the slide's content (text, which is
+    also its narration cues, pictures, media, layout, master and theme), the slide size and the
+    voice and render settings. Two slides with the same key produce the same narrated segment.
+    """
+    prs = backends.get("pptx").Presentation(ppt_path)
+    settings = json.dumps({"version": STORE_VERSION, "voice": voice, "fps": fps, "vert_resolution": vert_resolution,
+                           "tts": tts_backend, "size": [prs.slide_width, prs.slide_height]}, sort_keys=True)
+    memo = {}
+    keys = []
+    for slide in prs.slides:
+        digest = hashlib.sha256(settings.encode())
+        digest.update(_part_digest(slide.part, memo))
+        keys.append(digest.hexdigest()[:40])
+    return keys
+
+
+class SegmentStore:
+    """
+    Content-addressed store of finished per-slide segments shared by all decks.
+    Segments live under `root/objects/<key[:2]>/<key>.mp4`; `root/index.json` keeps their size and
+    last use, plus hit/miss counters. Lookups and additions are kept in memory and written by
+    flush(), once per conversion: under a lock file, the index on disk is merged with this
+    process's changes, segment files missing from it are adopted, and when the store is larger
+    than `max_bytes` the least recently used segments are evicted. Several processes can share
+    one store: a pinned segment has a lease file under `root/leases`, and no process evicts a
+    segment with a lease younger than LEASE_TIMEOUT.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._pinned = Counter()
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lease_dir = os.path.join(root, "leases")
+        self._changed = set()        # keys added or used since the last flush
+        self._hit_deltas = Counter()
+        self._counter_deltas = Counter()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(self._lease_dir, exist_ok=True)
+        self.entries, self.counters = self._read_index()
+        # Forget entries whose file was removed behind our back
+        self.entries = {key: entry for key, entry in self.entries.items() if os.path.exists(self.path(key))}
+
+    def path(self, key):
+        return os.path.join(self.root, "objects", key[:2], key + ".mp4")
+
+    def _lease_path(self, key):
+        return os.path.join(self._lease_dir, f"{key}.{self._owner}")
+
+    def _pin(self, key):
+        # Called with self._lock held; the lease exists before the segment is handed out
+        if not self._pinned[key]:
+            open(self._lease_path(key), "w").close()
+        self._pinned[key] += 1
+
+    def _leased(self, key, now):
+        """
+        True if any process holds a live lease on `key`; stale leases are removed.
+        """
+        leased = False
+        for name in os.listdir(self._lease_dir):
+            if not name.startswith(key + "."):
+                continue
+            lease = os.path.join(self._lease_dir, name)
+            try:
+                if now - os.path.getmtime(lease) < LEASE_TIMEOUT:
+                    leased = True
+                else:
+                    os.remove(lease)
+            except OSError:
+                pass
+        return leased
+
+    def _read_index(self):
+        counters = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "evicted_bytes": 0}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}, counters
+        counters.update(saved.get("counters", {}))
+        return saved.get("entries", {}), counters
+
+    @contextmanager
+    def _index_lock(self, timeout=60.0, stale_after=300.0):
+        """
+        Holds `index.json.lock` (created exclusively) while the index is merged and rewritten.
+        A lock file older than `stale_after` seconds was left by a crashed process and is broken.
+        """
+        lock_path = self.index_path + ".lock"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > stale_after:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Segment store index is locked by another process: {lock_path}")
+                time.sleep(0.05)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def _adopt_orphans(self, entries):
+        # Segments stored by a process that died before flushing are indexed, so they can be evicted
+        objects_dir = os.path.join(self.root, "objects")
+        for prefix in os.listdir(objects_dir):
+            prefix_dir = os.path.join(objects_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                key, ext = os.path.splitext(name)
+                if ext == ".mp4" and key not in entries:
+                    stat = os.stat(os.path.join(prefix_dir, name))
+                    entries[key] = {"size": stat.st_size, "created": stat.st_mtime, "last_used": stat.st_mtime,
+                                    "hits": 0}
+
+    def flush(self):
+        """
+        Merges this process's lookups and new segments into the index on disk, evicts down to
+        `max_bytes` and rewrites the index.
+        """
+        with self._index_lock(), self._lock:
+            entries, counters = self._read_index()
+            for key in self._changed:
+                mine = self.entries.get(key)
+                if mine is None:
+                    continue
+                theirs = entries.get(key, {})
+                entries[key] = dict(mine, last_used=max(mine["last_used"], theirs.get("last_used", 0)),
+                                    hits=theirs.get("hits", 0) + self._hit_deltas[key])
+            for name, delta in self._counter_deltas.items():
+                counters[name] = counters.get(name, 0) + delta
+            entries = {key: entry for key, entry in entries.items() if os.path.exists(self.path(key))}
+            self._adopt_orphans(entries)
+            self.entries, self.counters = entries, counters
+            self._changed.clear()
+            self._hit_deltas.clear()
+            self._counter_deltas.clear()
+            self._evict()
+
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self.entries, "counters": self.counters}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.index_path)
+
+    def get(self, key):
+        """
+        Returns the path of the cached segment and pins it, or None on a miss.
+        """
+        path = self.path(key)
+        # The lease is taken under the index lock, so no other process evicts the segment between
+        # the check that it exists and the lease
+        with self._index_lock(), self._lock:
+            entry = self.entries.get(key)
+            if not os.path.exists(path):
+                self.entries.pop(key, None)
+                self._counter_deltas["misses"] += 1
+                return None
+            self._pin(key)
+            if entry is None:
+                # Stored by another process since this index was read
+                stat = os.stat(path)
+                entry = self.entries[key] = {"size": stat.st_size, "created": stat.st_mtime, "hits": 0}
+            entry["last_used"] = time.time()
+            self._changed.add(key)
+            self._hit_deltas[key] += 1
+            self._counter_deltas["hits"] += 1
+        tracing.count("segment_store_hits")
+        return path
+
+    def put(self, key, video_path):
+        """
+        Moves a finished segment into the store, pins it and returns its stored path.
+        """
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with self._lock:
+            self._pin(key)   # before the segment is visible to other processes
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.move(video_path, tmp_path)
+        os.replace(tmp_path, target)
+        with self._lock:
+            now = time.time()
+            self.entries[key] = {"size": os.path.getsize(target), "created": now, "last_used": now, "hits": 0}
+            self._changed.add(key)
+            self._counter_deltas["stored"] += 1
+        return target
+
+    def release(self, keys):
+        with self._lock:
+            for key in keys:
+                self._pinned[key] -= 1
+                if self._pinned[key] <= 0:
+                    del self._pinned[key]
+                    try:
+                        os.remove(self._lease_path(key))
+                    except FileNotFoundError:
+                        pass
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self.entries.values())
+        now = time.time()
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if self._pinned[key] or self._leased(key, now):
+                continue
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue  # still open in another process (Windows); try again next time
+            size = self.entries.pop(key)["size"]
+            total -= size
+            self.counters["evicted"] += 1
+            self.counters["evicted_bytes"] += size
+
+    def evict(self):
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            for name, delta in self._counter_deltas.items():
+                counters[name] = counters.get(name, 0) + delta
+            lookups = counters["hits"] + counters["misses"]
+            return dict(counters,
+                        segments=len(self.entries),
+                        bytes=sum(entry["size"] for entry in self.entries.values()),
+                        max_bytes=self.max_bytes,
+                        hit_rate=counters["hits"] / lookups if lookups else 0.0)
+
+
+def cut_segments(video_path, audio_path, spans, output_files, fps=30):
+    """
+    Cuts a narrated video into clips with one ffmpeg run: clip i is `spans[i]` = (start, end) seconds
+    of the video with the same span of the narration. Every clip is encoded with the same settings
+    and starts on a key frame, so clips from any run can be joined by stream copy.
+    """
+    args = ["-i", video_path, "-i", audio_path]
+    for (start, end), output in zip(spans, output_files):
+        args += ["-map", "0:v", "-map", "1:a", "-ss", f"{start:.3f}", "-to", f"{end:.3f}",
+                 "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-r", str(fps),
+                 "-c:a", "aac", "-ar", str(CHUNK_SAMPLE_RATE), "-ac", "2", "-movflags", "+faststart", output]
+    with tracing.span("cut_segments", cat="encode", segments=len(spans)):
+        run_ffmpeg(args)
+    return output_files
+
+
+def render_with_powerpoint(deck_path, durations_map, output_video, fps=30, vert_resolution=720, settle_delay=5,
+                           progress_callback=None):
+    """
+    Default renderer of StoreConversion: applies the point timings and exports the deck with PowerPoint.
+    """
+    apply_point_timings(deck_path, durations_map, settle_delay=settle_delay)
+    ppt_to_video(deck_path, output_video, use_timings=True, fps=fps, vert_resolution=vert_resolution,
+                 settle_delay=settle_delay, progress_callback=progress_callback)
+    return output_video
+
+
+class StoreConversion:
+    """
+    Converts a deck through a SegmentStore in three steps that need different resources, so a job
+    queue can run them as separate stages:
+    narrate() looks every slide up in the store and synthesizes the narration of the missing ones
+    (TTS); render() exports one deck made of all missing slides, once (PowerPoint); assemble() cuts
+    that video into per-slide segments, stores them and splices the whole deck (ffmpeg).
+    A slide without narration has no length in the video (as in the full pipeline) and no segment.
+    Intermediate files go to `work_dir`, by default a folder under the store's `work` directory, so
+    nothing (such as the deck of missing slides) is written next to the source deck.
+    close() removes the work folder, releases the pinned segments and flushes the store index.
+    """
+
+    def __init__(self, ppt_path, output_video, store, work_dir=None, voice=DEFAULT_VOICE, synthesize=None,
+                 fps=30, vert_resolution=720, settle_delay=5, render=render_with_powerpoint):
+        self.ppt_path = ppt_path
+        self.output_video = output_video
+        self.store = store
+        if work_dir is None:
+            os.makedirs(os.path.join(store.root, "work"), exist_ok=True)
+            work_dir = tempfile.mkdtemp(prefix=os.path.splitext(os.path.basename(ppt_path))[0] + "_",
+                                        dir=os.path.join(store.root, "work"))
+        self.work_dir = work_dir
+        self.voice = voice
+        self.synthesize = synthesize
+        self.fps = fps
+        self.vert_resolution = vert_resolution
+        self.settle_delay = settle_delay
+        self.render_deck = render
+        self.keys = []
+        self.segments = {}    # slide index -> stored segment path, or None for a slide without narration
+        self.misses = []      # slides to render, one per distinct key, in deck order
+        self.audio_map = None
+        self.durations_map = None
+        self.misses_deck = os.path.join(self.work_dir, "misses.pptx")
+        self.misses_video = os.path.join(self.work_dir, "misses.mp4")
+        self._pinned = []
+
+    def narrate(self, progress_callback=None):
+        """
+        Returns False when every slide is already in the store.
+        """
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        os.makedirs(self.work_dir)
+        tts_backend = f"{self.synthesize.__module__}.{self.synthesize.__qualname__}" if self.synthesize else "edge_tts"
+        self.keys = slide_keys(self.ppt_path, voice=self.voice, fps=self.fps, vert_resolution=self.vert_resolution,
+                               tts_backend=tts_backend)
+        looked_up = set()
+        for slide_idx, key in enumerate(self.keys, start=1):
+            if key in looked_up:
+                continue  # the same slide again; it uses the segment of its first occurrence
+            looked_up.add(key)
+            cached = self.store.get(key)
+            if cached is None:
+                self.misses.append(slide_idx)
+            else:
+                self._pinned.append(key)
+                self.segments[slide_idx] = cached
+        print(f"♻️ {len(self.segments)}/{len(looked_up)} distinct slides reused from the segment store")
+        if not self.misses:
+            return False
+
+        extract_slides(self.ppt_path, self.misses, self.misses_deck)
+        self.audio_map = generate_audio_from_points(self.misses_deck, os.path.join(self.work_dir, "audio"),
+                                                    synthesize=self.synthesize, voice=self.voice,
+                                                    progress_callback=progress_callback)
+        self.durations_map = measure_durations(self.audio_map)
+        return True
+
+    def render(self, progress_callback=None):
+        """
+        Returns False when there is nothing to render.
+        """
+        if not self.misses:
+            return False
+        with tracing.span("render_misses", cat="segments", slides=len(self.misses)):
+            self.render_deck(self.misses_deck, self.durations_map, self.misses_video, fps=self.fps,
+                             vert_resolution=self.vert_resolution, settle_delay=self.settle_delay,
+                             progress_callback=progress_callback)
+        return True
+
+    def assemble(self, progress_callback=None):
+        if self.misses:
+            spans, outputs, keys, elapsed = [], [], [], 0.0
+            for misses_idx, slide_idx in enumerate(self.misses, start=1):
+                duration = sum(self.durations_map.get(misses_idx, []))
+                if duration > 0:
+                    spans.append((elapsed, elapsed + duration))
+                    outputs.append(os.path.join(self.work_dir, f"segment_{slide_idx}.mp4"))
+                    keys.append((slide_idx, self.keys[slide_idx - 1]))
+                else:
+                    self.segments[slide_idx] = None
+                elapsed += duration
+            if spans:
+                if progress_callback:
+                    progress_callback(10, f"Cutting {len(spans)} segments...")
+                narration = os.path.join(self.work_dir, "misses.wav")
+                combine_audio(self.audio_map, narration, format="wav")
+                cut_segments(self.misses_video, narration, spans, outputs, fps=self.fps)
+                for (slide_idx, key), output in zip(keys, outputs):
+                    self.segments[slide_idx] = self.store.put(key, output)
+                    self._pinned.append(key)
+
+        # Repeated slides use the segment of their first occurrence
+        first = {}
+        for slide_idx, key in enumerate(self.keys, start=1):
+            first.setdefault(key, slide_idx)
+        segments = [self.segments.get(first[key]) for key in self.keys]
+        segments = [segment for segment in segments if segment]
+        if not segments:
+            raise RuntimeError(f"{os.path.basename(self.ppt_path)} has no narrated slides")
+        if progress_callback:
+            progress_callback(80, "Splicing segments...")
+        concat_videos(segments, self.output_video)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        if progress_callback:
+            progress_callback(100, "Segments completed.")
+        return self.output_video
+
+    def close(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.store.release(self._pinned)
+        self._pinned = []
+        self.store.flush()
+
+
+def render_with_store(ppt_path, output_video, store, work_dir=None, progress_callback=None, **kwargs):
+    """
+    Converts a deck with StoreConversion in one go: slides already in the store are spliced in as
+    they are, all the others are rendered together once and added to the store.
+    """
+    conversion = StoreConversion(ppt_path, output_video, store, work_dir=work_dir, **kwargs)
+    try:
+        conversion.narrate()
+        conversion.render()
+        return conversion.assemble(progress_callback=progress_callback)
+    finally:
+        conversion.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or trim the shared slide segment store.")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--max-gb", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3)
+    parser.add_argument("--evict", action="store_true", help="Evict least recently used segments down to --max-gb")
+    args = parser.parse_args(argv)
+
+    store = SegmentStore(args.store, max_bytes=int(args.max_gb * 1024 ** 3))
+    if args.evict:
+        store.evict()
+    print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
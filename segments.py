@@ -0,0 +1,54 @@
+import os
+
+from generate_video import (
+    generate_audio_from_points,
+    measure_durations,
+    apply_point_timings,
+    ppt_to_video,
+    combine_audio,
+    DEFAULT_VOICE
+)
+from chunked_pipeline import mux_audio_video
+
+
+def render_segment(ppt_path: str,
+                   output_video: str,
+                   work_dir: str = None,
+                   voice: str = DEFAULT_VOICE,
+                   synthesize=None,
+                   fps: int = 30,
+                   vert_resolution: int = 720,
+                   settle_delay: float = 5,
+                   progress_callback=None):
+    """
+    Runs the whole pipeline on a (usually one- or few-slide) deck and produces a finished,
+    narrated video segment. Segments rendered with the same settings share codec parameters,
+    so they can be joined with ffmpeg_utils.concat_videos without re-encoding.
+    """
+    work_dir = work_dir or os.path.splitext(os.path.abspath(output_video))[0] + "_work"
+    os.makedirs(work_dir, exist_ok=True)
+    audio_dir = os.path.join(work_dir, "audio")
+    slide_video = os.path.join(work_dir, "slides.mp4")
+    narration = os.path.join(work_dir, "narration.wav")
+
+    def stage_progress(start, end, label):
+        if not progress_callback:
+            return None
+        return lambda p, m: progress_callback(start + (end - start) * min(p, 100) // 100, f"{label}: {m}")
+
+    audio_map = generate_audio_from_points(ppt_path, audio_dir, synthesize=synthesize, voice=voice,
+                                           progress_callback=stage_progress(0, 40, "Audio"))
+    durations_map = measure_durations(audio_map)
+    apply_point_timings(ppt_path, durations_map, settle_delay=settle_delay,
+                        progress_callback=stage_progress(40, 50, "Point timing"))
+    ppt_to_video(ppt_path, slide_video, use_timings=True, fps=fps, vert_resolution=vert_resolution,
+                 settle_delay=settle_delay, progress_callback=stage_progress(50, 90, "Video"))
+
+    if any(audio_map.values()):
+        combine_audio(audio_map, narration, format="wav")
+        mux_audio_video(slide_video, narration, output_video)
+    else:
+        mux_audio_video(slide_video, None, output_video)
+    if progress_callback:
+        progress_callback(100, "Segment completed.")
+    return output_video
@@ -0,0 +1,198 @@
+import sys
+import json
+import argparse
+import subprocess
+
+import numpy as np
+
+from ffmpeg_utils import get_ffmpeg_exe
+import backends
+import tracing
+
+ANALYSIS_FPS = 5
+FRAME_SIZE = (64, 36)
+# A pixel counts as changed when its gray level moves by more than this (0-255)
+PIXEL_THRESHOLD = 12
+# ... and a frame is a change point when at least this fraction of pixels changed
+MIN_CHANGED_FRACTION = 0.002
+
+
+def detect_change_points(video_path, fps=ANALYSIS_FPS, size=FRAME_SIZE, pixel_threshold=PIXEL_THRESHOLD,
+                         min_changed_fraction=MIN_CHANGED_FRACTION, block_frames=512):
+    """
+    Returns the times (seconds) at which the picture changes visibly.
+    ffmpeg decodes the video to tiny grayscale frames at `fps`; consecutive frames are differenced a
+    block at a time with numpy. A run of changing frames (e.g. a fade-in) counts as one change
+    point at its first frame, so times are accurate to 1 / fps.
+    """
+    width, height = size
+    frame_bytes = width * height
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-i", video_path, "-an",
+           "-vf", f"fps={fps},scale={width}:{height}:flags=area,format=gray", "-f", "rawvideo", "-"]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    changes = []
+    previous = None       # last frame of the previous block
+    frame_index = 0
+    in_change = False
+    with tracing.span("detect_change_points", cat="decode"):
+        try:
+            while True:
+                data = process.stdout.read(block_frames * frame_bytes)
+                if not data:
+                    break
+                frames = np.frombuffer(data[:len(data) - len(data) % frame_bytes], dtype=np.uint8)
+                frames = frames.reshape(-1, frame_bytes).astype(np.int16)
+                if previous is not None:
+                    frames = np.vstack([previous, frames])
+                    first_index = frame_index - 1
+                else:
+                    first_index = 0
+                changed = (np.abs(np.diff(frames, axis=0)) > pixel_threshold).mean(axis=1) >= min_changed_fraction
+                # frame first_index + i + 1 differs from the one before it
+                for i in np.flatnonzero(changed != np.concatenate([[in_change], changed[:-1]])):
+                    if changed[i]:
+                        changes.append(float(first_index + i + 1) / fps)
+                if len(changed):
+                    in_change = bool(changed[-1])
+                previous = frames[-1:]
+                frame_index = first_index + len(frames)
+        finally:
+            process.stdout.close()
+            stderr = process.stderr.read()
+            if process.wait() != 0:
+                raise RuntimeError(f"Could not decode {video_path}: {stderr.decode(errors='replace').strip()}")
+    return changes
+
+
+def count_slide_effects(ppt_path):
+    """
+    Number of animation effects on each (1-based) slide, read from the deck's timing XML.
+    """
+    prs = backends.get("pptx").Presentation(ppt_path)
+    counts = {}
+    for idx, slide in enumerate(prs.slides, start=1):
+        nodes = slide._element.xpath(".//p:timing//p:cTn/@nodeType")
+        counts[idx] = sum(1 for node in nodes if node in ("clickEffect", "withEffect", "afterEffect"))
+    return counts
+
+
+def expected_events(durations_map, effect_counts=None):
+    """
+    Where changes should appear, following apply_point_timings: slide s starts when the previous
+    slides' narration ends, and its k-th animated point appears after its first k cues have played.
+    Returns (time, slide, point) with point None for a slide change.
+    """
+    events = []
+    slide_start = 0.0
+    for slide_idx in sorted(durations_map):
+        durs = list(durations_map[slide_idx])
+        if slide_start > 0:
+            events.append((slide_start, slide_idx, None))
+        effects = len(durs) - 1
+        if effect_counts is not None:
+            effects = min(effects, effect_counts.get(slide_idx, 0))
+        elapsed = 0.0
+        for point in range(1, effects + 1):
+            elapsed += durs[point - 1]
+            events.append((slide_start + elapsed, slide_idx, point + 1))
+        slide_start += sum(durs)
+    return events
+
+
+def verify_sync(video_path, durations_map, ppt_path=None, tolerance=1.0, **detect_kwargs):
+    """
+    Matches every expected slide change and point appearance to a detected change point and reports
+    the drift per slide. Positive drift means the picture changed later than the narration.
+    An event is searched for as far as the neighbouring expected events (at least `tolerance`
+    seconds either way), and matches keep the order of the events, so a change that drifted by more
+    than `tolerance` is still found and reported with its actual drift instead of as missing.
+    """
+    detected = detect_change_points(video_path, **detect_kwargs)
+    effect_counts = count_slide_effects(ppt_path) if ppt_path else None
+    expected = expected_events(durations_map, effect_counts)
+
+    detected_times = np.array(detected)
+    used = np.zeros(len(detected), dtype=bool)
+    last_match = -np.inf
+    slides = {}
+    for i, (time_s, slide_idx, point) in enumerate(expected):
+        report = slides.setdefault(slide_idx, {"slide": slide_idx, "events": [], "missing": 0})
+        previous_time = expected[i - 1][0] if i > 0 else -np.inf
+        next_time = expected[i + 1][0] if i + 1 < len(expected) else np.inf
+        low = min(time_s - tolerance, previous_time)
+        high = max(time_s + tolerance, next_time)
+        match = None
+        if len(detected_times):
+            candidates = ~used & (detected_times > last_match) & (detected_times >= low) & (detected_times <= high)
+            distance = np.where(candidates, np.abs(detected_times - time_s), np.inf)
+            nearest = int(np.argmin(distance))
+            if np.isfinite(distance[nearest]):
+                used[nearest] = True
+                match = float(detected_times[nearest])
+                last_match = match
+        report["events"].append({"point": point, "expected": round(time_s, 3),
+                                 "detected": match, "drift": None if match is None else round(match - time_s, 3)})
+        if match is None:
+            report["missing"] += 1
+
+    for report in slides.values():
+        drifts = [abs(event["drift"]) for event in report["events"] if event["drift"] is not None]
+        report["max_drift"] = max(drifts) if drifts else None
+        report["mean_drift"] = round(float(np.mean(drifts)), 3) if drifts else None
+
+    all_drifts = [report["max_drift"] for report in slides.values() if report["max_drift"] is not None]
+    return {
+        "video": video_path,
+        "expected_events": len(expected),
+        "detected_changes": len(detected),
+        "unexpected_changes": int((~used).sum()),
+        "missing_events": sum(report["missing"] for report in slides.values()),
+        "max_drift": max(all_drifts) if all_drifts else None,
+        "slides": [slides[idx] for idx in sorted(slides)],
+    }
+
+
+def load_durations(path):
+    """
+    Reads a durations map saved as JSON ({"slide": [seconds, ...]}).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return {int(slide): durs for slide, durs in json.load(f).items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that points appear on screen when their narration starts.")
+    parser.add_argument("video", help="Final MP4")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--audio-dir", help="Folder with the slide_<n>_point_<m>.mp3 narration clips")
+    source.add_argument("--durations", help="JSON file mapping slide -> cue durations")
+    parser.add_argument("--deck", default=None, help="PPTX, to only expect changes for animated points")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Seconds searched at least around each expected change")
+    parser.add_argument("--max-drift", type=float, default=0.5, help="Fail when any change drifts more than this")
+    parser.add_argument("--json", default=None, help="Write the full report to this file")
+    args = parser.parse_args(argv)
+
+    if args.audio_dir:
+        from lip_sync import load_audio_map
+        from generate_video import measure_durations
+        durations_map = measure_durations(load_audio_map(args.audio_dir))
+    else:
+        durations_map = load_durations(args.durations)
+
+    report = verify_sync(args.video, durations_map, ppt_path=args.deck, tolerance=args.tolerance)
+    for slide in report["slides"]:
+        drift = "-" if slide["max_drift"] is None else f"{slide['max_drift']:.2f}s"
+        print(f"Slide {slide['slide']:>3}: {len(slide['events'])} changes, max drift {drift}, {slide['missing']} missing")
+    print(f"Expected {report['expected_events']}, detected {report['detected_changes']}, "
+          f"{report['missing_events']} missing, {report['unexpected_changes']} unexpected")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    too_late = report["max_drift"] is not None and report["max_drift"] > args.max_drift
+    return 1 if too_late or report["missing_events"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
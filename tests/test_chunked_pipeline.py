@@ -0,0 +1,109 @@
+import os
+import gc
+import tracemalloc
+
+import pytest
+
+import chunked_pipeline
+from chunked_pipeline import SpilledDurations, generate_audio_in_windows
+from ffmpeg_utils import run_ffmpeg
+import backends
+
+CUE_SECONDS = 0.1
+CUE_BYTES = 16 * 1024
+
+
+def build_deck(path, slides, bullets=5):
+    prs = backends.get("pptx").Presentation()
+    for idx in range(1, slides + 1):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {idx}"
+        body = slide.placeholders[1].text_frame
+        for bullet in range(bullets):
+            para = body.paragraphs[0] if bullet == 0 else body.add_paragraph()
+            para.text = f"Point {bullet} of slide {idx} with a few more words"
+    prs.save(path)
+    return path
+
+
+def fake_tts(text, fname, voice):
+    with open(fname, "wb") as f:
+        f.write(b"\0" * CUE_BYTES)
+
+
+@pytest.fixture
+def offline_audio(monkeypatch):
+    """
+    Replaces the moviepy/pydub steps of a window with fixed cue lengths and an ffmpeg silence chunk.
+    Like the real combine_audio, the stand-in holds all cues of the window in memory at once.
+    """
+    def measure(audio_map, progress_callback=None):
+        return {idx: [CUE_SECONDS] * len(files) for idx, files in audio_map.items()}
+
+    def combine(audio_map, output_audio, progress_callback=None, format="mp3"):
+        cues = [open(path, "rb").read() for files in audio_map.values() for path in files]
+        assert sum(len(cue) for cue in cues) == CUE_BYTES * len(cues)
+        run_ffmpeg(["-f", "lavfi", "-i", "anullsrc=r=8000:cl=mono", "-t", str(CUE_SECONDS * len(cues)),
+                    output_audio])
+
+    monkeypatch.setattr(chunked_pipeline, "measure_durations", measure)
+    monkeypatch.setattr(chunked_pipeline, "combine_audio", combine)
+
+
+def window_memory(tmp_path, slides, window=10):
+    """
+    Peak traced memory of the windowed narration beyond what the parsed deck itself takes.
+    """
+    work_dir = tmp_path / f"deck_{slides}"
+    work_dir.mkdir()
+    deck = build_deck(str(work_dir / "deck.pptx"), slides)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        prs = backends.get("pptx").Presentation(deck)
+        deck_bytes = tracemalloc.get_traced_memory()[0]
+        del prs
+        gc.collect()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        durations, chunks = generate_audio_in_windows(deck, str(work_dir), window, synthesize=fake_tts)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    try:
+        assert isinstance(durations, SpilledDurations)
+        assert len(durations) == slides
+        assert sum(len(durations[idx]) for idx in durations) == slides * 6
+        assert len(chunks) == -(-slides // window)
+    finally:
+        durations.close()
+    return peak - before - deck_bytes
+
+
+def test_window_memory_does_not_grow_with_the_deck(tmp_path, offline_audio):
+    window_memory(tmp_path, 10)   # first run imports and caches; not measured
+    small = window_memory(tmp_path, 40)
+    large = window_memory(tmp_path, 160)
+
+    assert large < 4 * 1024 ** 2
+    # Four times the slides: everything but the parsed deck stays within the window's working set
+    assert large < small * 1.5 + 256 * 1024
+
+
+def test_clips_are_recorded_per_window(tmp_path, offline_audio):
+    deck = build_deck(str(tmp_path / "deck.pptx"), 5, bullets=2)
+    audio_dir = tmp_path / "audio"
+    audio_dir.mkdir()
+    # Left over from an earlier version of the deck; not part of this narration
+    (audio_dir / "slide_2_point_9.mp3").write_bytes(b"stale")
+
+    clips = chunked_pipeline.SpilledClips(str(tmp_path / "clips.db"))
+    durations, _ = generate_audio_in_windows(deck, str(tmp_path), window=2, synthesize=fake_tts, clips=clips)
+    try:
+        assert list(clips) == [1, 2, 3, 4, 5]
+        for idx in clips:
+            assert len(clips[idx]) == len(durations[idx]) == 3
+            assert "slide_2_point_9.mp3" not in [os.path.basename(path) for path in clips[idx]]
+    finally:
+        durations.close()
+        clips.close()
@@ -0,0 +1,47 @@
+import time
+import threading
+
+from job_queue import ConversionJob, JobScheduler, DONE, PAUSED
+from progress import StageCostHistory
+
+
+class QuickJob(ConversionJob):
+    """
+    One short stage instead of the PowerPoint pipeline.
+    """
+
+    def stages(self):
+        return [("audio", "tts", self.run_quick)]
+
+    def run_quick(self, progress_callback):
+        for percent in (0, 50, 100):
+            time.sleep(0.01)
+            progress_callback(percent, "working")
+
+
+def add_job(scheduler, tmp_path, name):
+    job = QuickJob(str(tmp_path / f"{name}.pptx"))
+    with scheduler._cond:
+        scheduler._pending.append(job)
+        scheduler._cond.notify_all()
+    return job
+
+
+def wait(scheduler, timeout=10):
+    waiter = threading.Thread(target=scheduler.wait, daemon=True)
+    waiter.start()
+    waiter.join(timeout)
+    return not waiter.is_alive()
+
+
+def test_resumed_pending_jobs_are_always_dispatched(tmp_path):
+    scheduler = JobScheduler(max_jobs=1, cost_history=StageCostHistory(str(tmp_path / "costs.json")))
+    for round_idx in range(20):
+        scheduler.pause()
+        job = add_job(scheduler, tmp_path, f"queue_{round_idx}")
+        scheduler.pause(job.id)
+        assert job.status == PAUSED
+        scheduler.resume(job.id)
+        scheduler.resume()
+        assert wait(scheduler), f"job of round {round_idx} was never dispatched after resume"
+        assert job.status == DONE
@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+import textwrap
+
+import pytest
+
+import lip_sync
+from ffmpeg_utils import run_ffmpeg
+
+# Stand-in for the lip-sync model: logs every call, fails while <state_dir>/fail_<slide> holds a
+# non-zero count (negative = always) and otherwise "renders" by copying a prepared clip.
+STUB = textwrap.dedent("""
+    import os, sys, shutil
+    audio, output, template, state_dir = sys.argv[1:5]
+    slide = os.path.basename(audio).split("_")[1]
+    with open(os.path.join(state_dir, "calls.log"), "a") as f:
+        f.write(slide + "\\n")
+    fail_file = os.path.join(state_dir, "fail_" + slide)
+    if os.path.exists(fail_file):
+        left = int(open(fail_file).read())
+        if left != 0:
+            open(fail_file, "w").write(str(left - 1))
+            sys.exit(1)
+    shutil.copy(template, output)
+""")
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    template = tmp_path / "clip.mp4"
+    run_ffmpeg(["-f", "lavfi", "-i", "color=c=blue:s=64x64:r=10:d=1", "-f", "lavfi", "-i",
+                "anullsrc=r=44100:cl=stereo", "-t", "1", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", str(template)])
+    stub = tmp_path / "stub_lipsync.py"
+    stub.write_text(STUB)
+
+    audio_map = {}
+    for slide_idx in (1, 2, 3):
+        clip = tmp_path / f"slide_{slide_idx}_point_1.mp3"
+        clip.write_bytes(f"narration of slide {slide_idx}".encode())
+        audio_map[slide_idx] = [str(clip)]
+    face = tmp_path / "face.png"
+    face.write_bytes(b"face")
+
+    # The stub ignores the audio, so the chunk WAV does not need pydub
+    monkeypatch.setattr(lip_sync, "write_chunk_audio", lambda files, wav: shutil.copy(files[0], wav))
+    command = [sys.executable, str(stub), "{audio}", "{output}", str(template), str(state_dir)]
+    return audio_map, str(face), command, state_dir, tmp_path
+
+
+def calls(state_dir):
+    log = state_dir / "calls.log"
+    return sorted(log.read_text().split()) if log.exists() else []
+
+
+def test_failed_attempt_is_retried(setup):
+    audio_map, face, command, state_dir, tmp_path = setup
+    (state_dir / "fail_2").write_text("1")
+    output = str(tmp_path / "lipsync.mp4")
+
+    lip_sync.generate_lip_sync(audio_map, face, output, str(tmp_path), command=command, retries=1)
+
+    assert calls(state_dir) == ["1", "2", "2", "3"]
+    assert os.path.getsize(output) > 0
+
+
+def test_rerun_only_redoes_the_failed_chunk(setup):
+    audio_map, face, command, state_dir, tmp_path = setup
+    (state_dir / "fail_2").write_text("-1")
+    output = str(tmp_path / "lipsync.mp4")
+
+    with pytest.raises(RuntimeError, match=r"slides \[2\]"):
+        lip_sync.generate_lip_sync(audio_map, face, output, str(tmp_path), command=command, retries=1)
+    assert calls(state_dir) == ["1", "2", "2", "3"]
+    chunk_dir = tmp_path / "lip_sync_chunks"
+    # Only the finished chunks are cached; the failed one left no partial file behind
+    assert sorted(name.split("_")[1] for name in os.listdir(chunk_dir)) == ["1", "3"]
+    assert not os.path.exists(output)
+
+    (state_dir / "fail_2").unlink()
+    (state_dir / "calls.log").unlink()
+    lip_sync.generate_lip_sync(audio_map, face, output, str(tmp_path), command=command, retries=1)
+
+    assert calls(state_dir) == ["2"]
+    assert os.path.getsize(output) > 0
+
+
+# Stand-in for Wav2Lip's fixed intermediate file: every chunk writes temp/result.avi relative to
+# its working directory, waits, and fails if another chunk overwrote it in the meantime.
+FIXED_PATH_STUB = textwrap.dedent("""
+    import os, sys, time, shutil
+    audio, output, template = sys.argv[1:4]
+    with open(os.path.join("temp", "result.avi"), "w") as f:
+        f.write(audio)
+    time.sleep(0.5)
+    if open(os.path.join("temp", "result.avi")).read() != audio:
+        sys.exit("temp/result.avi was overwritten by another chunk")
+    shutil.copy(template, output)
+""")
+
+
+def test_parallel_chunks_do_not_share_fixed_temp_paths(setup):
+    audio_map, face, _, state_dir, tmp_path = setup
+    model_dir = tmp_path / "model"
+    (model_dir / "temp").mkdir(parents=True)
+    (model_dir / "inference.py").write_text(FIXED_PATH_STUB)
+    command = [sys.executable, "inference.py", "{audio}", "{output}", str(tmp_path / "clip.mp4")]
+    output = str(tmp_path / "lipsync.mp4")
+
+    lip_sync.generate_lip_sync(audio_map, face, output, str(tmp_path), command=command, cwd=str(model_dir),
+                               max_workers=3, retries=0)
+
+    assert os.path.getsize(output) > 0
+    assert os.listdir(model_dir / "temp") == []
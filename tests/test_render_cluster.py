@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import time
+import threading
+import subprocess
+
+import pytest
+
+from ffmpeg_utils import get_ffmpeg_exe, run_ffmpeg
+from render_cluster import Coordinator, RenderWorker, DONE
+import backends
+
+
+def build_deck(path, slides):
+    pptx = backends.get("pptx")
+    prs = pptx.Presentation()
+    for idx in range(1, slides + 1):
+        prs.slides.add_slide(prs.slide_layouts[5]).shapes.title.text = f"Slide {idx}"
+    prs.save(path)
+    return path
+
+
+def stub_render(deck_path, output_video, work_dir=None, **settings):
+    """
+    Renders one second of video per slide in the shard, without PowerPoint.
+    """
+    slides = len(backends.get("pptx").Presentation(deck_path).slides)
+    run_ffmpeg(["-f", "lavfi", "-i", f"color=c=gray:s=64x36:r=10:d={slides}", "-f", "lavfi", "-i",
+                "anullsrc=r=44100:cl=stereo", "-t", str(slides), "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", output_video])
+
+
+def video_duration(path):
+    result = subprocess.run([get_ffmpeg_exe(), "-hide_banner", "-i", path], stderr=subprocess.PIPE, text=True)
+    hours, minutes, seconds = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr).groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def start_coordinator(coordinator):
+    coordinator_thread = threading.Thread(target=coordinator.run, daemon=True)
+    coordinator_thread.start()
+    deadline = time.monotonic() + 30
+    while coordinator._server is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return coordinator_thread, f"http://127.0.0.1:{coordinator._server.server_address[1]}"
+
+
+def run_cluster(tmp_path, coordinator, renderers, before_workers=None, token=None):
+    coordinator_thread, url = start_coordinator(coordinator)
+    if before_workers:
+        before_workers(url)
+    workers = [threading.Thread(target=RenderWorker(url, worker_id=f"worker-{i}", work_dir=str(tmp_path / f"w{i}"),
+                                                    render=render, heartbeat_interval=0.2, poll_interval=0.1,
+                                                    token=token).run,
+                                daemon=True)
+               for i, render in enumerate(renderers)]
+    for worker in workers:
+        worker.start()
+    coordinator_thread.join(timeout=120)
+    for worker in workers:
+        worker.join(timeout=10)
+    assert not coordinator_thread.is_alive()
+
+
+def test_several_workers_render_one_deck(tmp_path):
+    deck = build_deck(str(tmp_path / "deck.pptx"), 7)
+    output = str(tmp_path / "deck.mp4")
+    coordinator = Coordinator(deck, output, shard_size=2, host="127.0.0.1", port=0)
+
+    run_cluster(tmp_path, coordinator, [stub_render] * 3)
+
+    assert [shard.slides for shard in coordinator.shards] == [[1, 2], [3, 4], [5, 6], [7]]
+    assert all(shard.state == DONE for shard in coordinator.shards)
+    assert len({shard.worker for shard in coordinator.shards}) > 1
+    assert video_duration(output) == pytest.approx(7, abs=0.3)
+
+
+def test_failed_shard_goes_to_another_attempt(tmp_path):
+    deck = build_deck(str(tmp_path / "deck.pptx"), 4)
+    output = str(tmp_path / "deck.mp4")
+    coordinator = Coordinator(deck, output, shard_size=1, host="127.0.0.1", port=0, max_attempts=3)
+    failures = []
+
+    def flaky_render(deck_path, output_video, **kwargs):
+        # The first attempt at whichever shard this worker gets first crashes
+        if not failures:
+            failures.append(deck_path)
+            raise RuntimeError("PowerPoint crashed")
+        stub_render(deck_path, output_video, **kwargs)
+
+    run_cluster(tmp_path, coordinator, [flaky_render, stub_render])
+
+    assert len(failures) == 1
+    assert all(shard.state == DONE for shard in coordinator.shards)
+    assert sorted(shard.attempts for shard in coordinator.shards) == [1, 1, 1, 2]
+    assert video_duration(output) == pytest.approx(4, abs=0.3)
+
+
+def test_shard_of_a_silent_worker_is_leased_again(tmp_path):
+    deck = build_deck(str(tmp_path / "deck.pptx"), 2)
+    output = str(tmp_path / "deck.mp4")
+    coordinator = Coordinator(deck, output, shard_size=1, host="127.0.0.1", port=0, lease_timeout=0.5)
+
+    def lease_and_vanish(url):
+        # A worker that leases the first shard and dies before its first heartbeat
+        status, body = RenderWorker(url, worker_id="ghost")._request("POST", "/lease", {"worker": "ghost"})
+        assert status == 200 and json.loads(body)["shard"] == 0
+
+    run_cluster(tmp_path, coordinator, [stub_render], before_workers=lease_and_vanish)
+
+    assert all(shard.state == DONE for shard in coordinator.shards)
+    assert coordinator.shards[0].attempts == 2
+    assert coordinator.shards[0].worker == "worker-0"
+    assert "no heartbeat from ghost" in coordinator.shards[0].error
+    assert video_duration(output) == pytest.approx(2, abs=0.3)
+
+
+def test_token_is_required_and_worker_names_are_sanitized(tmp_path):
+    deck = build_deck(str(tmp_path / "deck.pptx"), 1)
+    output = str(tmp_path / "deck.mp4")
+    with pytest.raises(ValueError, match="token"):
+        Coordinator(deck, output, host="0.0.0.0")
+    coordinator = Coordinator(deck, output, host="127.0.0.1", port=0, token="secret")
+
+    def intruders(url):
+        status, _ = RenderWorker(url, worker_id="intruder")._request("POST", "/lease", {"worker": "intruder"})
+        assert status == 401
+        status, _ = RenderWorker(url)._request("PUT", "/shards/0/segment?worker=..%2F..%2Fevil", data=b"x",
+                                               headers={"Content-Length": "1"})
+        assert status == 401
+
+    run_cluster(tmp_path, coordinator, [stub_render], before_workers=intruders, token="secret")
+
+    assert all(shard.state == DONE for shard in coordinator.shards)
+    assert sorted(os.listdir(coordinator.work_dir)) == ["segment_00000.mp4", "shard_00000.pptx"]
+    assert RenderWorker("http://x", worker_id="../..\\evil").worker_id == ".._.._evil"
@@ -0,0 +1,19 @@
+import pytest
+
+import sync_verifier
+
+
+@pytest.mark.parametrize("detected, drifts, unexpected", [
+    ([2.0, 4.2], [0.0, 0.2], 0),
+    # Drift above the 1 s tolerance is still matched and reported, not counted as missing
+    ([3.5, 5.5], [1.5, 1.5], 0),
+    ([0.6, 2.0, 4.0], [0.0, 0.0], 1),
+])
+def test_drift_is_reported_beyond_tolerance(monkeypatch, detected, drifts, unexpected):
+    monkeypatch.setattr(sync_verifier, "detect_change_points", lambda video_path, **kwargs: detected)
+    report = sync_verifier.verify_sync("deck.mp4", {1: [2.0, 2.0], 2: [3.0]}, tolerance=1.0)
+
+    events = [event for slide in report["slides"] for event in slide["events"]]
+    assert [event["drift"] for event in events] == drifts
+    assert report["missing_events"] == 0
+    assert report["unexpected_changes"] == unexpected
@@ -0,0 +1,41 @@
+import sys
+import pathlib
+import subprocess
+from collections import deque
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace(monkeypatch):
+    monkeypatch.setattr(tracing, "_events", deque(maxlen=tracing.MAX_EVENTS))
+    tracing.reset()
+    tracing.enable()
+    yield
+    tracing.disable()
+    tracing.reset()
+
+
+def spawned_programs():
+    return [event["args"]["program"] for event in tracing._events if event.get("name") == "spawn"]
+
+
+def test_popen_accepts_paths_while_tracing(trace):
+    python = pathlib.Path(sys.executable)
+    subprocess.run(python if sys.platform != "win32" else [python], input=b"", check=True)
+    subprocess.run([python, "-c", "pass"], check=True)
+
+    assert spawned_programs() == [python.name, python.name]
+    assert tracing.counters()["subprocesses"] == 2
+
+
+def test_events_are_capped(trace, monkeypatch):
+    monkeypatch.setattr(tracing, "_events", deque(maxlen=10))
+    for _ in range(25):
+        tracing.count("items")
+
+    assert len(tracing._events) == 10
+    assert tracing._dropped == 15
+    assert tracing.counters()["items"] == 25
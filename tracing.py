@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+import subprocess
+from collections import deque
+
+# Set AUTONARRATE_TRACE=<file.json> to trace any entry point and write the trace at exit.
+TRACE_ENV_VAR = "AUTONARRATE_TRACE"
+# Only the most recent events are kept, so a long-running process (watch mode) does not grow without limit
+MAX_EVENTS = 200_000
+
+enabled = False
+_events = deque(maxlen=MAX_EVENTS)
+_dropped = 0
+_counters = {}
+_thread_names = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+_epoch_ns = time.perf_counter_ns()
+_original_popen_init = subprocess.Popen.__init__
+
+
+def _now_us():
+    return (time.perf_counter_ns() - _epoch_ns) / 1000.0
+
+
+def _record(event):
+    # Called with _lock held
+    global _dropped
+    if len(_events) == _events.maxlen:
+        _dropped += 1
+    _events.append(event)
+
+
+class _NullSpan:
+    """Returned by span() while tracing is disabled; does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _now_us()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        thread = threading.current_thread()
+        event = {"name": self.name, "cat": self.cat, "ph": "X", "ts": self.start, "dur": end - self.start,
+                 "pid": _pid, "tid": thread.ident, "args": self.args}
+        with _lock:
+            _thread_names.setdefault(thread.ident, thread.name)
+            _record(event)
+        return False
+
+    def set(self, **args):
+        """Adds arguments to the span, e.g. results known only at the end."""
+        self.args.update(args)
+
+
+def span(name, cat="pipeline", **args):
+    """
+    Context manager timing a (nestable) block. Costs one flag check when tracing is disabled.
+    """
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def traced(name=None, cat="stage"):
+    """
+    Decorator that wraps every call of a function in a span.
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Span(span_name, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """
+    Adds `value` to a counter (e.g. bytes_read, bytes_written); recorded as a Chrome trace counter track.
+    """
+    if not enabled:
+        return
+    with _lock:
+        total = _counters.get(name, 0) + value
+        _counters[name] = total
+        _record({"name": name, "ph": "C", "ts": _now_us(), "pid": _pid, "args": {name: total}})
+
+
+def count_file(counter, path):
+    """
+    Adds the size of `path` to a byte counter.
+    """
+    if enabled and path and os.path.exists(path):
+        count(counter, os.path.getsize(path))
+
+
+def _program_name(args):
+    """
+    Name of the program Popen runs, for `args` as a string, bytes, path or sequence of them.
+    """
+    try:
+        program = args if isinstance(args, (str, bytes, os.PathLike)) else (args[0] if args else "")
+        return os.path.basename(os.fsdecode(program))
+    except (TypeError, IndexError, KeyError):
+        return "?"   # let Popen report invalid arguments itself
+
+
+def _counting_popen_init(self, args, *rest, **kwargs):
+    count("subprocesses")
+    with _lock:
+        _record({"name": "spawn", "cat": "subprocess", "ph": "i", "s": "t", "ts": _now_us(),
+                 "pid": _pid, "tid": threading.get_ident(), "args": {"program": _program_name(args)}})
+    _original_popen_init(self, args, *rest, **kwargs)
+
+
+def enable():
+    """
+    Starts recording spans and counters. Subprocess launches (ffmpeg from moviepy and pydub included)
+    are counted by wrapping subprocess.Popen while tracing is enabled.
+    """
+    global enabled
+    enabled = True
+    subprocess.Popen.__init__ = _counting_popen_init
+
+
+def disable():
+    global enabled
+    enabled = False
+    subprocess.Popen.__init__ = _original_popen_init
+
+
+def reset():
+    global _dropped
+    with _lock:
+        _dropped = 0
+        _events.clear()
+        _counters.clear()
+        _thread_names.clear()
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def export_chrome_trace(path):
+    """
+    Writes the recorded events in Chrome trace format (open in chrome://tracing or ui.perfetto.dev).
+    Beyond MAX_EVENTS, only the latest events are written; the number dropped is in otherData.
+    """
+    with _lock:
+        events = list(_events)
+        dropped = _dropped
+        metadata = [{"name": "thread_name", "ph": "M", "pid": _pid, "tid": tid, "args": {"name": name}}
+                    for tid, name in _thread_names.items()]
+        totals = dict(_counters)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms",
+                   "otherData": {"counters": totals, "dropped_events": dropped}}, f)
+    print(f"🧭 Trace saved to {path}")
+    return path
+
+
+def _enable_from_env():
+    trace_path = os.environ.get(TRACE_ENV_VAR)
+    if trace_path:
+        enable()
+        atexit.register(export_chrome_trace, trace_path)
+
+
+_enable_from_env()
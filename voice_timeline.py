@@ -0,0 +1,219 @@
+import json
+import argparse
+import subprocess
+from collections import deque, namedtuple
+
+import numpy as np
+
+from ffmpeg_utils import get_ffmpeg_exe
+import tracing
+
+SAMPLE_RATE = 16000   # what the age/gender model expects
+GENDER_LABELS = ("Female", "Male", "Child")
+
+VoiceSegment = namedtuple("VoiceSegment", ["start", "end", "gender", "age"])
+
+
+def stream_audio(audio_path, sample_rate=SAMPLE_RATE, block_seconds=30.0):
+    """
+    Decodes any audio/video file to mono float32 at `sample_rate` through an ffmpeg pipe and
+    yields it in blocks of `block_seconds`, so the whole recording is never held in memory.
+    """
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-i", audio_path,
+           "-vn", "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"]
+    block_bytes = int(block_seconds * sample_rate) * 4
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"Could not decode {audio_path}: {stderr.decode(errors='replace').strip()}")
+
+
+def sliding_windows(blocks, window, hop, min_rms_db=-40.0):
+    """
+    Cuts a stream of sample blocks into overlapping windows of `window` samples every `hop` samples.
+    Yields (start_sample, samples, voiced) where `voiced` comes from a vectorized RMS energy gate.
+    Only the samples of the window in progress are carried from one block to the next.
+    """
+    threshold = (10 ** (min_rms_db / 20)) ** 2
+    buffer = np.zeros(0, dtype=np.float32)
+    buffer_start = 0   # absolute sample index of buffer[0]
+    emitted = False
+
+    for block in blocks:
+        buffer = np.concatenate([buffer, block])
+        count = (len(buffer) - window) // hop + 1
+        if count <= 0:
+            continue
+        # Mean energy of every window from one cumulative sum instead of one pass per window
+        energy = np.concatenate([[0.0], np.cumsum(buffer.astype(np.float64) ** 2)])
+        starts = np.arange(count) * hop
+        voiced = (energy[starts + window] - energy[starts]) / window >= threshold
+        for offset, is_voiced in zip(starts, voiced):
+            yield buffer_start + int(offset), buffer[offset:offset + window], bool(is_voiced)
+        emitted = True
+        consumed = count * hop
+        buffer = buffer[consumed:]
+        buffer_start += consumed
+
+    if not emitted and len(buffer):
+        # Recording shorter than one window: classify it padded with silence
+        padded = np.zeros(window, dtype=np.float32)
+        padded[:len(buffer)] = buffer
+        yield 0, padded, bool(np.mean(buffer.astype(np.float64) ** 2) >= threshold)
+
+
+def _classify_in_batches(windows, classify, batch_size, window):
+    """
+    Runs `classify` on batches of voiced windows; yields (start_sample, prediction or None) in order.
+    """
+    batch = np.zeros((batch_size, window), dtype=np.float32)
+    pending = []   # (start, slot in batch or None for silent windows)
+    filled = 0
+
+    def flush():
+        predictions = classify(batch[:filled]) if filled else None
+        for start, slot in pending:
+            yield start, (predictions[slot] if slot is not None else None)
+
+    for start, samples, voiced in windows:
+        if voiced:
+            batch[filled] = samples
+            pending.append((start, filled))
+            filled += 1
+        elif not filled:
+            yield start, None
+        else:
+            pending.append((start, None))
+        if filled == batch_size:
+            yield from flush()
+            pending, filled = [], 0
+    yield from flush()
+
+
+class _Smoother:
+    """
+    Centered moving average of the predictions over `size` windows, emitted with a delay of size // 2 windows.
+    Silent windows stay silent and are left out of their neighbours' averages.
+    """
+
+    def __init__(self, size):
+        self.half = max(1, size) // 2
+        self.items = deque()   # (index, start, prediction)
+        self.received = 0
+        self.emitted = 0
+
+    def _emit(self):
+        index = self.emitted
+        neighbours = [p for i, _, p in self.items if abs(i - index) <= self.half and p is not None]
+        start, prediction = next((s, p) for i, s, p in self.items if i == index)
+        self.emitted += 1
+        while self.items and self.items[0][0] < self.emitted - self.half:
+            self.items.popleft()
+        return start, (np.mean(neighbours, axis=0) if prediction is not None else None)
+
+    def push(self, start, prediction):
+        self.items.append((self.received, start, prediction))
+        self.received += 1
+        smoothed = []
+        while self.emitted + self.half < self.received:
+            smoothed.append(self._emit())
+        return smoothed
+
+    def flush(self):
+        return [self._emit() for _ in range(self.received - self.emitted)]
+
+
+def iter_voice_timeline(audio_path, window_seconds=2.0, hop_seconds=0.5, batch_size=16, min_rms_db=-40.0,
+                        smooth=5, classify=None, sample_rate=SAMPLE_RATE, block_seconds=30.0):
+    """
+    Streams a long recording and yields VoiceSegment(start, end, gender, age) as soon as each segment ends.
+    Windows of `window_seconds` every `hop_seconds` are classified `batch_size` at a time, windows quieter
+    than `min_rms_db` are skipped, and predictions are smoothed over `smooth` windows. Each window
+    stands for the `hop_seconds` around its centre; age is in years.
+    `classify(batch)` maps (batch, samples) float32 windows to rows of [age, female, male, child]
+    (default: gender_classifier.process_batch).
+    """
+    if classify is None:
+        from gender_classifier import process_batch
+        classify = process_batch
+    window = int(window_seconds * sample_rate)
+    hop = int(hop_seconds * sample_rate)
+
+    blocks = stream_audio(audio_path, sample_rate, block_seconds)
+    windows = sliding_windows(blocks, window, hop, min_rms_db)
+    smoother = _Smoother(smooth)
+    current = None   # [gender, start, end, age_sum, count]
+
+    def spans(results):
+        nonlocal current
+        for start, prediction in results:
+            if prediction is None:
+                if current:
+                    yield current
+                current = None
+                continue
+            centre = (start + window / 2) / sample_rate
+            span_start = 0.0 if start == 0 else centre - hop_seconds / 2
+            span_end = centre + hop_seconds / 2
+            gender = GENDER_LABELS[int(np.argmax(prediction[1:4]))]
+            if current and current[0] == gender:
+                current[2] = span_end
+                current[3] += float(prediction[0])
+                current[4] += 1
+            else:
+                if current:
+                    yield current
+                current = [gender, span_start, span_end, float(prediction[0]), 1]
+
+    def segment(state):
+        gender, start, end, age_sum, count = state
+        return VoiceSegment(round(start, 3), round(end, 3), gender, round(100 * age_sum / count, 1))
+
+    with tracing.span("voice_timeline", cat="model", window=window_seconds, hop=hop_seconds):
+        for start, prediction in _classify_in_batches(windows, classify, batch_size, window):
+            for state in spans(smoother.push(start, prediction)):
+                yield segment(state)
+        for state in spans(smoother.flush()):
+            yield segment(state)
+        if current:
+            yield segment(current)
+
+
+def analyze_voice_timeline(audio_path, **kwargs):
+    """
+    Returns the whole timeline of iter_voice_timeline as a list.
+    """
+    return list(iter_voice_timeline(audio_path, **kwargs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Age/gender timeline of a long recording.")
+    parser.add_argument("audio", help="Audio or video file")
+    parser.add_argument("--window", type=float, default=2.0, help="Window length in seconds")
+    parser.add_argument("--hop", type=float, default=0.5, help="Seconds between window starts")
+    parser.add_argument("--batch", type=int, default=16, help="Windows per model forward pass")
+    parser.add_argument("--min-rms-db", type=float, default=-40.0, help="Windows quieter than this are skipped")
+    parser.add_argument("--smooth", type=int, default=5, help="Windows averaged when smoothing labels")
+    parser.add_argument("--json", default=None, help="Also write the timeline to this JSON file")
+    args = parser.parse_args(argv)
+
+    timeline = []
+    for segment in iter_voice_timeline(args.audio, window_seconds=args.window, hop_seconds=args.hop,
+                                       batch_size=args.batch, min_rms_db=args.min_rms_db, smooth=args.smooth):
+        print(f"{segment.start:9.2f} - {segment.end:9.2f}  {segment.gender:<6} {segment.age:5.1f}", flush=True)
+        timeline.append(segment._asdict())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(timeline, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()